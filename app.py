@@ -1,12 +1,27 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
 import os
-from flask import Flask, render_template, request, send_file
+import time
+from io import BytesIO
+from flask import Flask, Response, g, jsonify, redirect, render_template, request, send_file, url_for
 from markupsafe import Markup
 import pandas as pd
 import numpy as np
-from io import BytesIO
-from dataclasses import dataclass
-from typing import Any, List, Optional
+from dataclasses import asdict
+from result_store import DEFAULT_RUNS_DIR, RunStore
+from upload_cache import DEFAULT_CACHE_DIR, UploadCache
+from jobs import DEFAULT_JOBS_DIR, JobManager, QueueFull
+from metrics import Registry, StageTimings
+from run_history import DEFAULT_HISTORY_PATH, RunHistory
+# ליבת השיבוץ (בלי Flask) – ראו placement.py
+from placement import (
+    MATCH_MODES, RESOLVE_VERSION, RESOLVED_SITE_COLS, RESOLVED_STUDENT_COLS, Weights,
+    MissingColumnsError, capacity_report, check_columns, check_delta, csv_chunks, explanations_frame,
+    gazetteer, partner_report, read_header, read_sites_table, read_students_table, rematch,
+    rematch_diff, rematch_results, resolve_sites, resolve_students, results_view, run_matching,
+    summarize_results, supervisor_codes, supervisor_overflow, write_csv, write_xlsx,
+)
 
 app = Flask(__name__)
 
@@ -18,7 +33,7 @@ def maintenance_mode():
     כל בקשה תחזיר דף 'האתר סגור'.
     לפתיחה: לשנות ל-0 או להסיר את המשתנה.
     """
-    if os.getenv("MAINTENANCE_MODE", "0") == "1":
+    if os.getenv("MAINTENANCE_MODE", "0") == "1" and request.endpoint != "metrics_endpoint":
         html = """
         <html lang="he" dir="rtl">
         <head>
@@ -56,303 +71,227 @@ def maintenance_mode():
         """
         return Markup(html), 503
 
-# ========= מודל ניקוד =========
-@dataclass
-class Weights:
-    w_field: float = 0.50   # תחום
-    w_city: float = 0.05    # עיר
-    w_special: float = 0.45 # בקשות מיוחדות
-
-# עמודות סטודנטים
-STU_COLS = {
-    "id": ["מספר תעודת זהות", "תעודת זהות", "ת\"ז", "תז", "תעודת זהות הסטודנט"],
-    "first": ["שם פרטי"],
-    "last": ["שם משפחה"],
-    # חדש – כתובת, למקרה שאין עמודת עיר
-    "address": ["כתובת", "כתובת מלאה", "כתובת הסטודנט"],
-    "city": ["עיר מגורים", "עיר"],
-    "phone": ["טלפון", "מספר טלפון"],
-    "email": ["דוא\"ל", "דוא״ל", "אימייל", "כתובת אימייל", "כתובת מייל"],
-    "preferred_field": ["תחום מועדף", "תחומים מועדפים"],
-    "special_req": ["בקשה מיוחדת"],
-    "partner": ["בן/בת זוג להכשרה", "בן\\בת זוג להכשרה", "בן/בת זוג", "בן\\בת זוג"]
+# ========= קריאת קבצים שהועלו =========
+def load_students_bytes(data: bytes, filename: str) -> pd.DataFrame:
+    return upload_cache.load_resolved_bytes(data, filename, "students", RESOLVE_VERSION,
+                                            read_students_table, resolve_students, RESOLVED_STUDENT_COLS)
+
+def load_sites_bytes(data: bytes, filename: str) -> pd.DataFrame:
+    return upload_cache.load_resolved_bytes(data, filename, "sites", RESOLVE_VERSION,
+                                            read_sites_table, resolve_sites, RESOLVED_SITE_COLS)
+
+# ========= מאגר תוצאות לפי ריצה =========
+# משותף לכל ה-workers דרך תיקיית RESULTS_DIR (ברירת מחדל: תיקייה זמנית)
+run_store = RunStore(
+    root=os.getenv("RESULTS_DIR", DEFAULT_RUNS_DIR),
+    max_runs=int(os.getenv("RESULTS_MAX_RUNS", "16")),
+    max_bytes=int(os.getenv("RESULTS_MAX_MB", "256")) * 1024 * 1024,
+    ttl_seconds=int(os.getenv("RESULTS_TTL_HOURS", "6")) * 3600,
+)
+
+# ========= יצוא להורדה =========
+# הקבצים נוצרים פעם אחת ונשמרים בתיקיית הריצה; הורדה חוזרת רק שולחת את הקובץ מהדיסק.
+# טבלה -> (שם ה-frame בריצה, שם הגיליון, שם הקובץ להורדה)
+EXPORT_TABLES = {
+    "results": ("view", "תוצאות", "student_site_matching"),
+    "summary": ("summary", "סיכום", "student_site_summary"),
 }
-
-# עמודות אתרים
-SITE_COLS = {
-    "name": ["מוסד / שירות הכשרה", "מוסד", "שם מוסד ההתמחות", "שם המוסד", "מוסד ההכשרה"],
-    "field": ["תחום ההתמחות", "תחום התמחות"],
-    "street": ["רחוב"],
-    "city": ["עיר"],
-    "capacity": ["מספר סטודנטים שניתן לקלוט השנה", "מספר סטודנטים שניתן לקלוט", "קיבולת"],
-    "sup_first": ["שם פרטי"],
-    "sup_last": ["שם משפחה"],
-    "phone": ["טלפון"],
-    "email": ["אימייל", "כתובת מייל", "דוא\"ל", "דוא״ל"],
-    "review": ["חוות דעת מדריך"]
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",  # Flask מוסיף charset=utf-8 בעצמו
+    "parquet": "application/vnd.apache.parquet",
 }
 
-# ========= פונקציות עזר =========
-def pick_col(df: pd.DataFrame, options: List[str]) -> Optional[str]:
-    for opt in options:
-        if opt in df.columns:
-            return opt
-    return None
-
-def read_any(uploaded) -> pd.DataFrame:
-    name = (uploaded.filename or "").lower()
-    if name.endswith(".csv"):
-        return pd.read_csv(uploaded, encoding="utf-8-sig")
-    if name.endswith((".xlsx", ".xls")):
-        return pd.read_excel(uploaded)
-    return pd.read_csv(uploaded, encoding="utf-8-sig")
-
-def normalize_text(x: Any) -> str:
-    if x is None or (isinstance(x, float) and np.isnan(x)):
-        return ""
-    return str(x).strip()
-
-# --- סטודנטים ---
-def resolve_students(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-
-    out["stu_id"] = out[pick_col(out, STU_COLS["id"])]
-    out["stu_first"] = out[pick_col(out, STU_COLS["first"])]
-    out["stu_last"] = out[pick_col(out, STU_COLS["last"])]
-
-    # עיר – קודם מנסים עמודת "עיר", ואם אין – מחלצים מהכתובת (החלק אחרי הפסיק)
-    city_col = pick_col(out, STU_COLS["city"])
-    if city_col:
-        out["stu_city"] = out[city_col]
-    else:
-        addr_col = pick_col(out, STU_COLS.get("address", []))
-        if addr_col:
-            out["stu_city"] = out[addr_col].apply(
-                lambda x: str(x).split(",")[-1].strip() if isinstance(x, str) and "," in x else ""
-            )
-        else:
-            out["stu_city"] = ""
-
-    pref_col = pick_col(out, STU_COLS["preferred_field"])
-    out["stu_pref"] = out[pref_col] if pref_col else ""
-
-    req_col = pick_col(out, STU_COLS["special_req"])
-    out["stu_req"] = out[req_col] if req_col else ""
-
-    for c in ["stu_id", "stu_first", "stu_last", "stu_city", "stu_pref", "stu_req"]:
-        out[c] = out[c].apply(normalize_text)
-
-    return out
-
-# --- אתרים ---
-def resolve_sites(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    out["site_name"] = out[pick_col(out, SITE_COLS["name"])]
-    out["site_field"] = out[pick_col(out, SITE_COLS["field"])]
-    out["site_city"] = out[pick_col(out, SITE_COLS["city"])]
-
-    cap_col = pick_col(out, SITE_COLS["capacity"])
-    if cap_col:
-        out["site_capacity"] = pd.to_numeric(out[cap_col], errors="coerce").fillna(1).astype(int)
-    else:
-        out["site_capacity"] = 1
-    out["capacity_left"] = out["site_capacity"].astype(int)
-
-    sup_first = pick_col(out, SITE_COLS["sup_first"])
-    sup_last = pick_col(out, SITE_COLS["sup_last"])
-    out["שם המדריך"] = ""
-    if sup_first or sup_last:
-        ff = out[sup_first] if sup_first else ""
-        ll = out[sup_last] if sup_last else ""
-        out["שם המדריך"] = (ff.astype(str) + " " + ll.astype(str)).str.strip()
-
-    for c in ["site_name", "site_field", "site_city", "שם המדריך"]:
-        out[c] = out[c].apply(normalize_text)
-    return out
-
-# --- ציון + פירוק לפי 50/45/5 ---
-def compute_score_with_explain(stu: pd.Series, site: pd.Series, W: Weights):
-    stu_city   = normalize_text(stu.get("stu_city", "")).lower()
-    site_city  = normalize_text(site.get("site_city", "")).lower()
-    stu_pref   = normalize_text(stu.get("stu_pref", "")).lower()
-    site_field = normalize_text(site.get("site_field", "")).lower()
-    stu_req    = normalize_text(stu.get("stu_req", ""))
-
-    # 1) תחום – 50%
-    # לסטודנט/ית יכולים להיות כמה תחומים: "רווחה; שיקום; קהילה"
-    if stu_pref:
-        tokens = [t.strip() for t in stu_pref.replace(";", ",").split(",") if t.strip()]
-        if tokens:
-            field_component = 100 if any(tok in site_field for tok in tokens) else 0
-        else:
-            field_component = 70
-    else:
-        field_component = 70  # ניטרלי חלקי כשאין העדפה בכלל
-
-    # 2) עיר – 5%
-    if stu_city and site_city:
-        city_component = 100 if stu_city == site_city else 0
-    else:
-        city_component = 50  # ניטרלי כשאין מידע מלא
-
-    # 3) בקשות מיוחדות – 45%
-    stu_req_lower = stu_req.lower()
-    # "קרוב לבית" – אם יש גם עיר, בודקים התאמה; אם אין – ניטרלי
-    if "קרוב" in stu_req_lower:
-        if stu_city and site_city:
-            special_component = 100 if stu_city == site_city else 0
-        else:
-            special_component = 50  # לא מענישים על חוסר מידע
-    # "אזור צפון" – התאמה חלקית אם המוסד בצפון
-    elif "צפון" in stu_req_lower:
-        north_cities = ["צפת", "כרמיאל", "נהריה", "עכו", "קריית שמונה", "טבריה", "חורפיש"]
-        north_cities = [c.lower() for c in north_cities]
-        if site_city in north_cities:
-            special_component = 75  # חלקי – בסביבות 80–85% יחד עם תחום
-        else:
-            special_component = 50
-    else:
-        # אין בקשה מיוחדת – ניטרלי
-        special_component = 50
-
-    parts = {
-        "התאמת תחום": round(W.w_field * field_component),
-        "מרחק/גיאוגרפיה": round(W.w_city * city_component),
-        "בקשות מיוחדות": round(W.w_special * special_component),
-        "עדיפויות הסטודנט/ית": 0
-    }
-    score = int(np.clip(sum(parts.values()), 0, 100))
-    return score, parts
-
-def greedy_match(students_df: pd.DataFrame, sites_df: pd.DataFrame, W: Weights) -> pd.DataFrame:
-    results = []
-    supervisor_count = {}  # עד 2 סטודנטים לכל מדריך (ניתן לשנות)
-
-    for _, s in students_df.iterrows():
-        cand = sites_df[sites_df["capacity_left"] > 0].copy()
-
-        # אין בכלל מקומות פנויים
-        if cand.empty:
-            results.append({
-                "ת\"ז הסטודנט": s["stu_id"],
-                "שם פרטי": s["stu_first"],
-                "שם משפחה": s["stu_last"],
-                "שם מקום ההתמחות": "לא שובץ",
-                "עיר המוסד": "",
-                "תחום ההתמחות במוסד": "",
-                "שם המדריך": "",
-                "אחוז התאמה": 0,
-                "_expl": {
-                    "התאמת תחום": 0,
-                    "מרחק/גיאוגרפיה": 0,
-                    "בקשות מיוחדות": 0,
-                    "עדיפויות הסטודנט/ית": 0
-                }
-            })
+def write_exports(run_id: str, frames: dict) -> None:
+    """XLSX ו-CSV לכל טבלת הורדה (Parquet כבר קיים – זה הקובץ שהמאגר עצמו כותב)."""
+    for table, (frame, sheet_name, _) in EXPORT_TABLES.items():
+        df = frames.get(frame)
+        if df is None or df.empty:
             continue
+        run_store.write_artifact(run_id, f"{table}.xlsx", lambda path: write_xlsx(df, path, sheet_name))
+        run_store.write_artifact(run_id, f"{table}.csv", lambda path: write_csv(df, path))
+
+# ========= היסטוריית ריצות (SQLite) =========
+# כל ריצה נשמרת גם כאן, בלי TTL – לשאילתות בין ריצות (ראו /api/history/...)
+history = RunHistory(os.getenv("HISTORY_DB", DEFAULT_HISTORY_PATH))
+
+def fingerprint(*parts: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part)
+    return digest.hexdigest()
+
+# ========= מטמון העלאות לפי תוכן =========
+upload_cache = UploadCache(
+    root=os.getenv("UPLOAD_CACHE_DIR", DEFAULT_CACHE_DIR),
+    max_entries=int(os.getenv("UPLOAD_CACHE_MAX_FILES", "64")),
+    max_bytes=int(os.getenv("UPLOAD_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
+
+# ========= מדדים =========
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram(
+    "placement_stage_seconds", "Duration of pipeline and request stages", ["stage", "source"])
+REQUEST_SECONDS = metrics.histogram(
+    "placement_request_seconds", "Duration of HTTP requests", ["endpoint", "status"])
+ROWS_PROCESSED = metrics.counter(
+    "placement_rows_processed_total", "Rows processed by matching jobs", ["kind"])
+UPLOAD_CACHE_LOOKUPS = metrics.counter(
+    "placement_upload_cache_total", "Upload cache lookups by matching jobs", ["result"])
+JOBS_FINISHED = metrics.counter(
+    "placement_jobs_total", "Finished matching jobs", ["state", "mode"])
+
+def record_job_metrics(job: dict) -> None:
+    """נקרא בתהליך השרת כשעבודה מסתיימת – מעביר את המדידות מתהליך העבודה למדדים."""
+    JOBS_FINISHED.inc(state=job.get("state", ""), mode=job.get("mode", ""))
+    for stage, seconds in job.get("timings", {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage, source="job")
+    for kind, rows in job.get("rows", {}).items():
+        ROWS_PROCESSED.inc(rows, kind=kind)
+    for result, count in job.get("cache", {}).items():
+        UPLOAD_CACHE_LOOKUPS.inc(count, result=result)
 
-        # מחשבים ציון לכל אתר
-        def score_row(r):
-            sc, parts = compute_score_with_explain(s, r, W)
-            return pd.Series({"score": sc, "_parts": parts})
-
-        cand[["score", "_parts"]] = cand.apply(score_row, axis=1)
-
-        # מסננים לפי מגבלת מדריך (עד 2 סטודנטים למשל)
-        def allowed_supervisor(r):
-            sup = r.get("שם המדריך", "")
-            return supervisor_count.get(sup, 0) < 2
-
-        filtered = cand[cand.apply(allowed_supervisor, axis=1)]
-
-        # אם אין אתר שעובר את סינון המדריכים – בוחרים את הטוב מכל הפנויים
-        if filtered.empty:
-            all_sites = sites_df[sites_df["capacity_left"] > 0].copy()
-            if all_sites.empty:
-                results.append({
-                    "ת\"ז הסטודנט": s["stu_id"],
-                    "שם פרטי": s["stu_first"],
-                    "שם משפחה": s["stu_last"],
-                    "שם מקום ההתמחות": "לא שובץ",
-                    "עיר המוסד": "",
-                    "תחום ההתמחות במוסד": "",
-                    "שם המדריך": "",
-                    "אחוז התאמה": 0,
-                    "_expl": {
-                        "התאמת תחום": 0,
-                        "מרחק/גיאוגרפיה": 0,
-                        "בקשות מיוחדות": 0,
-                        "עדיפויות הסטודנט/ית": 0
-                    }
-                })
-                continue
-            all_sites[["score", "_parts"]] = all_sites.apply(score_row, axis=1)
-            filtered = all_sites.sort_values("score", ascending=False).head(1)
-        else:
-            filtered = filtered.sort_values("score", ascending=False)
-
-        chosen = filtered.iloc[0]
-        idx = chosen.name
-
-        # מעדכנים קיבולת
-        sites_df.at[idx, "capacity_left"] -= 1
-
-        # מעדכנים ספירת סטודנטים למדריך
-        sup_name = chosen.get("שם המדריך", "")
-        supervisor_count[sup_name] = supervisor_count.get(sup_name, 0) + 1
-
-        # שורת תוצאה
-        results.append({
-            "ת\"ז הסטודנט": s["stu_id"],
-            "שם פרטי": s["stu_first"],
-            "שם משפחה": s["stu_last"],
-            "שם מקום ההתמחות": chosen["site_name"],
-            "עיר המוסד": chosen.get("site_city", ""),
-            "תחום ההתמחות במוסד": chosen["site_field"],
-            "שם המדריך": sup_name,
-            "אחוז התאמה": int(chosen["score"]),
-            "_expl": chosen["_parts"]
-        })
-
-    return pd.DataFrame(results)
-
-# --- יצירת XLSX ---
-def df_to_xlsx_bytes(df: pd.DataFrame, sheet_name: str = "שיבוץ") -> bytes:
-    xlsx_io = BytesIO()
-    import xlsxwriter
-
-    with pd.ExcelWriter(xlsx_io, engine="xlsxwriter") as writer:
-        cols = list(df.columns)
-        has_match_col = "אחוז התאמה" in cols
-        if has_match_col:
-            cols = [c for c in cols if c != "אחוז התאמה"] + ["אחוז התאמה"]
-
-        df[cols].to_excel(writer, index=False, sheet_name=sheet_name)
-
-        if has_match_col:
-            workbook = writer.book
-            worksheet = writer.sheets[sheet_name]
-            red_fmt = workbook.add_format({"font_color": "red"})
-            col_idx = len(cols) - 1
-            worksheet.set_column(col_idx, col_idx, 12, red_fmt)
-
-    xlsx_io.seek(0)
-    return xlsx_io.getvalue()
-
-# ========= משתנים גלובליים =========
-last_results_df: Optional[pd.DataFrame] = None
-last_summary_df: Optional[pd.DataFrame] = None
+@app.before_request
+def start_timings():
+    g.timings = StageTimings()
+    g.job_timings = None
+    g.started = time.perf_counter()
+
+@app.after_request
+def emit_timings(response):
+    timings = g.get("timings")
+    if timings is None:
+        return response
+    total = time.perf_counter() - g.started
+    for stage, seconds in timings.stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage, source="request")
+    REQUEST_SECONDS.observe(total, endpoint=request.endpoint or "", status=response.status_code)
+    timings.add("total", total)
+    response.headers["Server-Timing"] = timings.server_timing(g.job_timings)
+    return response
+
+# ========= עבודות שיבוץ ברקע =========
+job_manager = JobManager(
+    root=os.getenv("JOBS_DIR", DEFAULT_JOBS_DIR),
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("JOB_QUEUE_SIZE", "8")),
+    ttl_seconds=run_store.ttl_seconds,
+    on_finish=record_job_metrics,
+)
+
+def match_job(job_id: str, status, students_data: bytes, students_name: str,
+              sites_data: bytes, sites_name: str, mode: str) -> None:
+    """רץ בתהליך עבודה: קריאה -> שיבוץ -> סיכום, ושמירת הריצה במאגר תחת job_id."""
+    timings = StageTimings()
+    cache_before = upload_cache.stats()
+    status.write(stage="reading", mode=mode)
+    with timings.stage("read_students"):
+        students = load_students_bytes(students_data, students_name)
+    with timings.stage("read_sites"):
+        sites = load_sites_bytes(sites_data, sites_name)
+    cache_after = upload_cache.stats()
+
+    status.write(stage="matching", progress={"done": 0, "total": len(students)})
+    with timings.stage("match"):
+        W = Weights()
+        base_df, report, assign = run_matching(students, sites, W, mode=mode, progress=status.progress,
+                                               return_assignment=True)
+
+    status.write(stage="summarizing")
+    with timings.stage("summary"):
+        summary_df = summarize_results(base_df)
+    with timings.stage("capacities"):
+        cap_df = capacity_report(base_df, sites)
+    with timings.stage("store"):
+        # הטבלאות המזוהות והשיבוץ נשמרים כדי לאפשר שיבוץ מחדש לפי שינויים (rematch_run)
+        frames = {"results": base_df, "view": results_view(base_df),
+                  "summary": summary_df, "capacities": cap_df,
+                  "students": students, "sites": sites,
+                  "assignment": pd.DataFrame({"site": assign})}
+        meta = {"mode": mode, "report": report, "weights": asdict(W)}
+        run_store.put(job_id, frames, meta=meta)
+    with timings.stage("history"):
+        history.record(job_id, base_df, cap_df, meta,
+                       students_fp=fingerprint(students_data), sites_fp=fingerprint(sites_data))
+    status.write(stage="exporting")
+    with timings.stage("exports"):
+        write_exports(job_id, frames)
+
+    status.write(
+        timings=timings.stages,
+        rows={"students": len(students), "sites": len(sites)},
+        cache={"hit": cache_after["hits"] - cache_before["hits"],
+               "miss": cache_after["misses"] - cache_before["misses"]},
+    )
+
+def rematch_run(run_id: str, delta: dict):
+    """
+    שיבוץ מחדש של ריצה שמורה לפי delta (ראו rematch). התוצאה נשמרת כריצה חדשה;
+    מחזיר (מזהה הריצה החדשה, טבלת ההבדלים). ריצה שלא נמצאה -> KeyError, delta לא תקין -> ValueError.
+    """
+    run = run_store.get(run_id)
+    if run is None or "assignment" not in run.frames:
+        raise KeyError(run_id)
+    W = Weights(**run.meta.get("weights", {}))
+    prev_results = run.frames["results"]
+    assign = run.frames["assignment"]["site"].to_numpy(dtype=np.int64)
+    score = np.where(assign >= 0, prev_results["אחוז התאמה"].to_numpy(dtype=np.int64), -1)
+
+    outcome = rematch(run.frames["students"], run.frames["sites"], assign, score, W, delta)
+    base_df = rematch_results(prev_results, outcome, W)
+    diff = rematch_diff(prev_results, base_df, outcome.old_pos)
+
+    placed = outcome.assign >= 0
+    report = {
+        "mode": "rematch",
+        "parent_run": run_id,
+        "total_score": int(outcome.score[placed].sum()),
+        "assigned": int(placed.sum()),
+        "supervisor_overflow": supervisor_overflow(outcome.assign, supervisor_codes(outcome.sites)),
+        "recomputed": int(outcome.changed.sum()),
+        "changes": len(diff),
+    }
+    if len(outcome.pairs) or outcome.partner_issues:
+        report["partners"] = partner_report(outcome.students, outcome.sites, outcome.pairs,
+                                            outcome.placed, outcome.assign, outcome.partner_issues)
+    new_id = run_store.new_run_id()
+    cap_df = capacity_report(base_df, outcome.sites)
+    meta = {"mode": run.meta.get("mode", "greedy"), "report": report, "weights": asdict(W)}
+    run_store.put(new_id, {"results": base_df, "view": results_view(base_df),
+                           "summary": summarize_results(base_df), "capacities": cap_df,
+                           "students": outcome.students, "sites": outcome.sites,
+                           "assignment": pd.DataFrame({"site": outcome.assign})}, meta=meta)
+    # טביעת הקלט של ריצה משנית: טביעת ההורה + ה-delta
+    parent = history.run(run_id) or {}
+    delta_fp = json.dumps(delta, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    history.record(new_id, base_df, cap_df, meta,
+                   students_fp=fingerprint((parent.get("students_fp") or "").encode(), delta_fp),
+                   sites_fp=fingerprint((parent.get("sites_fp") or "").encode(), delta_fp))
+    return new_id, diff
+
+def submit_match_job(students_file, sites_file, mode: str) -> str:
+    """
+    בודק את שורת הכותרות של שני הקבצים (עמודה חסרה -> MissingColumnsError מיד, לפני התור)
+    ושולח את העבודה לתור.
+    """
+    if mode not in MATCH_MODES:
+        raise ValueError(f"שיטת שיבוץ לא מוכרת: {mode}")
+    students_data, students_name = students_file.read(), students_file.filename or ""
+    sites_data, sites_name = sites_file.read(), sites_file.filename or ""
+    with g.timings.stage("validate"):
+        check_columns(read_header(BytesIO(students_data), students_name), "students")
+        check_columns(read_header(BytesIO(sites_data), sites_name), "sites")
+    job_id = run_store.new_run_id()
+    return job_manager.submit(job_id, match_job, students_data, students_name, sites_data, sites_name, mode)
 
 # ========= ראוט ראשי =========
 @app.route("/", methods=["GET", "POST"])
 def index():
-    global last_results_df, last_summary_df
-
     context = {
-        "results": None,
-        "summary": None,
-        "capacities": None,
-        "explanations": None,  # <- לרינדור הדפדוף
+        "report": None,
+        "mode": request.form.get("mode", "greedy"),
+        "run_id": None,
+        "job": None,
         "error": None
     }
 
@@ -365,127 +304,256 @@ def index():
             return render_template("index.html", **context)
 
         try:
-            df_students_raw = read_any(students_file)
-            df_sites_raw = read_any(sites_file)
-
-            students = resolve_students(df_students_raw)
-            sites = resolve_sites(df_sites_raw)
-
-            base_df = greedy_match(students, sites, Weights())
-            last_results_df = base_df.copy()
-
-            # טבלת תוצאות להצגה
-            df_show = pd.DataFrame({
-                "אחוז התאמה": base_df["אחוז התאמה"].astype(int),
-                "שם הסטודנט/ית": (base_df["שם פרטי"].astype(str) + " " + base_df["שם משפחה"].astype(str)).str.strip(),
-                "תעודת זהות": base_df["ת\"ז הסטודנט"],
-                "תחום התמחות": base_df["תחום ההתמחות במוסד"],
-                "עיר המוסד": base_df["עיר המוסד"],
-                "שם מקום ההתמחות": base_df["שם מקום ההתמחות"],
-                "שם המדריך/ה": base_df["שם המדריך"],
-            }).sort_values("אחוז התאמה", ascending=False)
-
-            # סיכום לפי אתר/תחום/מדריך
-            summary_df = (
-                base_df
-                .groupby(["שם מקום ההתמחות", "תחום ההתמחות במוסד", "שם המדריך"])
-                .agg({
-                    "ת\"ז הסטודנט": "count",
-                    "שם פרטי": list,
-                    "שם משפחה": list
-                }).reset_index()
-            )
-            summary_df.rename(columns={"ת\"ז הסטודנט": "כמה סטודנטים"}, inplace=True)
-            summary_df["המלצת שיבוץ"] = summary_df.apply(
-                lambda row: " + ".join(
-                    [f"{f} {l}" for f, l in zip(row["שם פרטי"], row["שם משפחה"])]
-                ),
-                axis=1
-            )
-            summary_df = summary_df[[
-                "שם מקום ההתמחות",
-                "תחום ההתמחות במוסד",
-                "שם המדריך",
-                "כמה סטודנטים",
-                "המלצת שיבוץ"
-            ]]
-            last_summary_df = summary_df.copy()
-
-            # קיבולות מול שיבוץ בפועל
-            caps = sites.groupby("site_name")["site_capacity"].sum().to_dict()
-            assigned = base_df.groupby("שם מקום ההתמחות")["ת\"ז הסטודנט"].count().to_dict()
-            cap_rows = []
-            for site_name, capacity in caps.items():
-                used = int(assigned.get(site_name, 0))
-                cap_rows.append({
-                    "שם מקום ההתמחות": site_name,
-                    "קיבולת": int(capacity),
-                    "שובצו בפועל": used,
-                    "יתרה/חוסר": int(capacity - used)
-                })
-            cap_df = pd.DataFrame(cap_rows).sort_values("שם מקום ההתמחות")
-
-            # הסברים לכל הסטודנטים
-            explanations = []
-            for _, r in base_df.iterrows():
-                explanations.append({
-                    "student": f"{r['שם פרטי']} {r['שם משפחה']}",
-                    "site": r["שם מקום ההתמחות"],
-                    "score": int(r["אחוז התאמה"]),
-                    "parts": r["_expl"]  # {"התאמת תחום":..., "מרחק/גיאוגרפיה":..., ...}
-                })
-
+            with g.timings.stage("submit"):
+                job_id = submit_match_job(students_file, sites_file, context["mode"])
+        except QueueFull:
+            context["error"] = "המערכת עמוסה כרגע בשיבוצים אחרים. נסו שוב בעוד מספר דקות."
+            return render_template("index.html", **context), 503
+        except MissingColumnsError as e:
+            context["error"] = str(e)
+            return render_template("index.html", **context), 400
+        except Exception as e:
+            context["error"] = f"שגיאה במהלך השיבוץ: {e}"
+            return render_template("index.html", **context)
+        return redirect(url_for("index", run=job_id))
+
+    run_id = request.args.get("run")
+    if run_id:
+        with g.timings.stage("store_load"):
+            run = run_store.get(run_id)
+            job = job_manager.status(run_id)
+        if job is not None:
+            g.job_timings = job.get("timings")
+        if run is not None:
+            # הטבלאות עצמן נטענות בעמודים מ-/api/runs/<run_id>/<table>
             context.update({
-                "results": df_show.to_dict(orient="records"),
-                "summary": summary_df.to_dict(orient="records"),
-                "capacities": cap_df.to_dict(orient="records"),
-                "explanations": explanations,
-                "error": None
+                "report": run.meta.get("report"),
+                "mode": run.meta.get("mode", "greedy"),
+                "run_id": run_id,
             })
+        elif job is not None and job.get("state") == "failed":
+            context["error"] = f"שגיאה במהלך השיבוץ: {job.get('error', '')}"
+        elif job is not None:
+            context["job"] = job
+        else:
+            context["error"] = "הריצה לא נמצאה או שפג תוקפה. יש להעלות את הקבצים מחדש."
+
+    with g.timings.stage("render"):
+        return render_template("index.html", **context)
+
+# ========= API לעבודות =========
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    students_file = request.files.get("students_file")
+    sites_file = request.files.get("sites_file")
+    if not students_file or not sites_file:
+        return jsonify(error="יש להעלות גם קובץ סטודנטים וגם קובץ אתרי התמחות."), 400
+    try:
+        job_id = submit_match_job(students_file, sites_file, request.form.get("mode", "greedy"))
+    except QueueFull:
+        return jsonify(error="התור מלא"), 503
+    except MissingColumnsError as e:
+        return jsonify(error=str(e), missing=e.missing, header=e.header), 400
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(job_id=job_id, status_url=url_for("job_status", job_id=job_id),
+                   results_url=url_for("index", run=job_id)), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_manager.status(job_id)
+    if job is None:
+        return jsonify(error="עבודה לא נמצאה"), 404
+    job.pop("traceback", None)
+    return jsonify(job)
+
+# ========= שיבוץ מחדש לפי שינויים =========
+@app.route("/api/runs/<run_id>/rematch", methods=["POST"])
+def api_rematch(run_id):
+    delta = request.get_json(silent=True)
+    if not isinstance(delta, dict):
+        return jsonify(error="יש לשלוח delta כ-JSON"), 400
+    try:
+        check_delta(delta)
+        with g.timings.stage("rematch"):
+            new_id, diff = rematch_run(run_id, delta)
+    except KeyError:
+        return jsonify(error="הריצה לא נמצאה או שפג תוקפה"), 404
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    diff = diff.astype(object).where(diff.notna(), None)
+    return jsonify(run_id=new_id, results_url=url_for("index", run=new_id),
+                   changes=diff.to_dict(orient="records"))
+
+# ========= API לטבלאות של ריצה (דפדוף / מיון / סינון) =========
+RUN_TABLES = {
+    "results": lambda run: run.frames["view"],
+    "summary": lambda run: run.frames["summary"],
+    "capacities": lambda run: run.frames["capacities"],
+    "explanations": lambda run: explanations_frame(run.frames["results"]),
+}
+MAX_PER_PAGE = 500
 
-        except Exception as e:
-            context["error"] = f"שגיאה במהלך השיבוץ: {e}"
+def _nested_column(df: pd.DataFrame, col: str) -> bool:
+    """עמודה של dict / list (למשל פירוק הציון) – לא מחפשים בה ולא ממיינים לפיה."""
+    return bool(len(df)) and isinstance(df[col].iloc[0], (dict, list))
 
-    return render_template("index.html", **context)
+def sortable_columns(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if not _nested_column(df, c)]
+
+def page_frame(df: pd.DataFrame, page: int = 1, per_page: int = 50, sort: str = "",
+               order: str = "asc", q: str = "") -> dict:
+    """
+    סינון (חיפוש טקסט בעמודות הטקסט), מיון ודפדוף בצד השרת.
+    sort שאינו עמודה שאפשר למיין לפיה -> ValueError.
+    """
+    if sort and sort not in sortable_columns(df):
+        raise ValueError(f"אי אפשר למיין לפי העמודה: {sort}")
+    if q:
+        q = q.lower()
+        text_cols = [c for c in df.columns
+                     if df[c].dtype == object or pd.api.types.is_string_dtype(df[c])]
+        mask = np.zeros(len(df), dtype=bool)
+        for c in text_cols:
+            if _nested_column(df, c):
+                continue
+            mask |= df[c].astype(str).str.lower().str.contains(q, regex=False).to_numpy()
+        df = df[mask]
+    if sort:
+        df = df.sort_values(sort, ascending=(order != "desc"), kind="stable")
+
+    per_page = min(max(1, per_page), MAX_PER_PAGE)
+    total = len(df)
+    pages = max(1, -(-total // per_page))
+    page = min(max(1, page), pages)
+    chunk = df.iloc[(page - 1) * per_page: page * per_page]
+    return {
+        "page": page,
+        "per_page": per_page,
+        "pages": pages,
+        "total": total,
+        "columns": list(df.columns),
+        "rows": chunk.to_dict(orient="records"),
+    }
+
+@app.route("/api/runs/<run_id>/<table>")
+def api_run_table(run_id, table):
+    if table not in RUN_TABLES:
+        return jsonify(error="טבלה לא מוכרת"), 404
+    with g.timings.stage("store_load"):
+        run = run_store.get(run_id)
+    if run is None:
+        return jsonify(error="הריצה לא נמצאה או שפג תוקפה"), 404
+    with g.timings.stage("page"):
+        try:
+            payload = page_frame(
+                RUN_TABLES[table](run),
+                page=request.args.get("page", 1, type=int),
+                per_page=request.args.get("per_page", 50, type=int),
+                sort=request.args.get("sort", ""),
+                order=request.args.get("order", "asc"),
+                q=request.args.get("q", "").strip(),
+            )
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+    return jsonify(payload)
+
+# ========= היסטוריית ריצות =========
+MAX_HISTORY = 500
+
+def history_limit(default: int) -> int:
+    return min(max(1, request.args.get("limit", default, type=int)), MAX_HISTORY)
+
+@app.route("/api/history/runs")
+def api_history_runs():
+    with g.timings.stage("history"):
+        return jsonify(runs=history.runs(history_limit(50)))
+
+@app.route("/api/history/runs/<run_id>")
+def api_history_run(run_id):
+    with g.timings.stage("history"):
+        run = history.run(run_id)
+        if run is None:
+            return jsonify(error="הריצה לא נמצאה בהיסטוריה"), 404
+        run["assignments"] = history.run_assignments(run_id)
+    return jsonify(run)
+
+@app.route("/api/history/students/<stu_id>")
+def api_history_student(stu_id):
+    with g.timings.stage("history"):
+        return jsonify(stu_id=stu_id, placements=history.student_history(stu_id, history_limit(3)))
+
+@app.route("/api/history/sites/<path:site_name>")
+def api_history_site(site_name):
+    with g.timings.stage("history"):
+        return jsonify(site=site_name, loads=history.site_history(site_name, history_limit(50)))
+
+@app.route("/api/history/supervisors/<path:supervisor>")
+def api_history_supervisor(supervisor):
+    with g.timings.stage("history"):
+        return jsonify(supervisor=supervisor, runs=history.supervisor_history(supervisor, history_limit(50)))
+
+# ========= יישובים =========
+@app.route("/api/localities/within")
+def api_localities_within():
+    city = request.args.get("city", "").strip()
+    km = request.args.get("km", 25.0, type=float)
+    try:
+        found = gazetteer.within(city, max(0.0, km))
+    except KeyError:
+        return jsonify(error="יישוב לא מוכר"), 404
+    return jsonify(city=gazetteer.names[gazetteer.lookup(city)], km=km,
+                   localities=[{"name": name, "km": dist} for name, dist in found])
 
 # ========= הורדות =========
+def download_table(table: str, empty_message: str):
+    """
+    הורדת טבלה מריצה בפורמט ?format=xlsx|csv|parquet (ברירת מחדל xlsx).
+    קובץ שכבר נוצר נשלח מהדיסק; אחרת הוא נוצר עכשיו ונשמר לצד הריצה –
+    CSV נשלח ללקוח תוך כדי כתיבה.
+    """
+    run_id = request.args.get("run", "")
+    fmt = request.args.get("format", "xlsx")
+    if fmt not in EXPORT_FORMATS:
+        return "פורמט לא נתמך", 400
+    frame, sheet_name, basename = EXPORT_TABLES[table]
+    filename = f"{table}.{fmt}" if fmt != "parquet" else f"{frame}.parquet"
+    download_name = f"{basename}.{fmt}"
+
+    with g.timings.stage("export_lookup"):
+        # Parquet: הטבלה עצמה כפי שנשמרה בריצה; xlsx / csv: קובץ יצוא שנוצר קודם
+        path = (run_store.frame_path(run_id, frame) if fmt == "parquet"
+                else run_store.artifact_path(run_id, filename))
+    if path is None:
+        with g.timings.stage("store_load"):
+            df = run_store.get_frame(run_id, frame)
+        if df is None or df.empty:
+            return empty_message, 400
+        if fmt == "csv":
+            return Response(
+                run_store.stream_artifact(run_id, filename, csv_chunks(df)),
+                mimetype=EXPORT_FORMATS[fmt],
+                headers={"Content-Disposition": f"attachment; filename={download_name}"},
+            )
+        with g.timings.stage(fmt):
+            if fmt == "xlsx":
+                path = run_store.write_artifact(run_id, filename, lambda p: write_xlsx(df, p, sheet_name))
+            else:
+                path = run_store.write_artifact(run_id, filename, lambda p: df.to_parquet(p, index=False))
+    return send_file(path, as_attachment=True, download_name=download_name, mimetype=EXPORT_FORMATS[fmt])
+
 @app.route("/download/results")
 def download_results():
-    global last_results_df
-    if last_results_df is None or last_results_df.empty:
-        return "אין נתוני שיבוץ להורדה", 400
-
-    df_show = pd.DataFrame({
-        "אחוז התאמה": last_results_df["אחוז התאמה"].astype(int),
-        "שם הסטודנט/ית": (last_results_df["שם פרטי"].astype(str) + " " + last_results_df["שם משפחה"].astype(str)).str.strip(),
-        "תעודת זהות": last_results_df["ת\"ז הסטודנט"],
-        "תחום התמחות": last_results_df["תחום ההתמחות במוסד"],
-        "עיר המוסד": last_results_df["עיר המוסד"],
-        "שם מקום ההתמחות": last_results_df["שם מקום ההתמחות"],
-        "שם המדריך/ה": last_results_df["שם המדריך"],
-    }).sort_values("אחוז התאמה", ascending=False)
-
-    data = df_to_xlsx_bytes(df_show, sheet_name="תוצאות")
-    return send_file(
-        BytesIO(data),
-        as_attachment=True,
-        download_name="student_site_matching.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    return download_table("results", "אין נתוני שיבוץ להורדה")
 
 @app.route("/download/summary")
 def download_summary():
-    global last_summary_df
-    if last_summary_df is None or last_summary_df.empty:
-        return "אין טבלת סיכום להורדה", 400
-
-    data = df_to_xlsx_bytes(last_summary_df, sheet_name="סיכום")
-    return send_file(
-        BytesIO(data),
-        as_attachment=True,
-        download_name="student_site_summary.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    return download_table("summary", "אין טבלת סיכום להורדה")
+
+# ========= מדדים ל-Prometheus =========
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+בדיקת ביצועים לשלבי השיבוץ על מחזורים סינתטיים בכמה גדלים.
+
+    python benchmarks/run_benchmarks.py                       # 100 / 1000 / 5000 / 20000 סטודנטים
+    python benchmarks/run_benchmarks.py --sizes 100 2000 --repeat 3
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/bench-20260101-120000.json
+
+לכל גודל ולכל שלב נמדדים זמן (הטוב מבין --repeat הרצות) ושיא זיכרון (tracemalloc, בהרצה נפרדת
+כדי שהמדידה לא תעוות את הזמנים). התוצאות נשמרות כ-JSON להשוואה בין גרסאות.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import placement  # noqa: E402
+from synthetic_cohort import generate_cohort  # noqa: E402
+
+DEFAULT_SIZES = [100, 1000, 5000, 20000]
+PAIRWISE_SAMPLE = 20000  # מספר זוגות למדידת compute_score_with_explain (הפונקציה הישנה, זוג-זוג)
+
+
+def _xlsx_bytes(df: pd.DataFrame) -> bytes:
+    buf = BytesIO()
+    df.to_excel(buf, index=False, engine="xlsxwriter")
+    return buf.getvalue()
+
+
+def _pairwise(students: pd.DataFrame, sites: pd.DataFrame, W, seed: int) -> int:
+    rng = np.random.default_rng(seed)
+    n = min(PAIRWISE_SAMPLE, len(students) * len(sites))
+    rows_i = rng.integers(0, len(students), size=n)
+    rows_j = rng.integers(0, len(sites), size=n)
+    stu_rows = [students.iloc[i] for i in range(len(students))]
+    site_rows = [sites.iloc[j] for j in range(len(sites))]
+    for i, j in zip(rows_i, rows_j):
+        placement.compute_score_with_explain(stu_rows[i], site_rows[j], W)
+    return n
+
+
+def pipeline_stages(students_raw: pd.DataFrame, sites_raw: pd.DataFrame, seed: int):
+    """
+    רשימת (שם שלב, פונקציה). כל פונקציה מקבלת מילון state, מעדכנת אותו ומחזירה מספר פריטים שעובדו.
+    קובצי ה-XLSX נבנים מראש ואינם חלק מהמדידה.
+    """
+    W = placement.Weights()
+    students_xlsx = _xlsx_bytes(students_raw)
+    sites_xlsx = _xlsx_bytes(sites_raw)
+
+    def read_xlsx(st):
+        st["students_raw"] = placement.read_students_table(BytesIO(students_xlsx), "students.xlsx")
+        st["sites_raw"] = placement.read_sites_table(BytesIO(sites_xlsx), "sites.xlsx")
+        return len(st["students_raw"]) + len(st["sites_raw"])
+
+    def resolve_students(st):
+        st["students"] = placement.resolve_students(st["students_raw"])
+        return len(st["students"])
+
+    def resolve_sites(st):
+        st["sites"] = placement.resolve_sites(st["sites_raw"])
+        return len(st["sites"])
+
+    def score_pairwise(st):
+        return _pairwise(st["students"], st["sites"], W, seed)
+
+    def score_matrix(st):
+        st["scores"] = placement.ScoreMatrix(st["students"], st["sites"], W)
+        return int(np.prod(st["scores"].shape))
+
+    def greedy_match(st):
+        sites = st["sites"].copy()
+        st["results"] = placement.greedy_match(st["students"], sites, W, scores=st["scores"])
+        return len(st["results"])
+
+    def df_to_xlsx_bytes(st):
+        st["xlsx"] = placement.df_to_xlsx_bytes(placement.results_view(st["results"]), sheet_name="תוצאות")
+        return len(st["results"])
+
+    def write_xlsx(st):
+        # הנתיב שמשמש בפועל לייצוא (run_pipeline / הורדות): כתיבה ישירה לקובץ, שורה אחרי שורה
+        with tempfile.TemporaryDirectory() as tmp:
+            placement.write_xlsx(placement.results_view(st["results"]), os.path.join(tmp, "results.xlsx"),
+                                 sheet_name="תוצאות")
+        return len(st["results"])
+
+    return [
+        ("read_xlsx", read_xlsx),
+        ("resolve_students", resolve_students),
+        ("resolve_sites", resolve_sites),
+        ("compute_score_with_explain", score_pairwise),
+        ("score_matrix", score_matrix),
+        ("greedy_match", greedy_match),
+        ("df_to_xlsx_bytes", df_to_xlsx_bytes),
+        ("write_xlsx", write_xlsx),
+    ]
+
+
+def bench_size(n_students: int, n_sites: int, seed: int, repeat: int, memory: bool) -> list:
+    students_raw, sites_raw = generate_cohort(n_students, n_sites, seed)
+    stages = pipeline_stages(students_raw, sites_raw, seed)
+
+    timings = {name: float("inf") for name, _ in stages}
+    items = {}
+    for _ in range(max(1, repeat)):
+        state = {}
+        for name, fn in stages:
+            t0 = time.perf_counter()
+            items[name] = fn(state)
+            timings[name] = min(timings[name], time.perf_counter() - t0)
+
+    peaks = {}
+    if memory:
+        state = {}
+        tracemalloc.start()
+        try:
+            for name, fn in stages:
+                tracemalloc.reset_peak()
+                base, _ = tracemalloc.get_traced_memory()
+                fn(state)
+                _, peak = tracemalloc.get_traced_memory()
+                peaks[name] = (peak - base) / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    rows = []
+    for name, _ in stages:
+        rows.append({
+            "students": len(students_raw),
+            "sites": len(sites_raw),
+            "stage": name,
+            "seconds": round(timings[name], 6),
+            "items": int(items[name]),
+            "peak_mb": round(peaks[name], 3) if name in peaks else None,
+        })
+    return rows
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_table(rows: list, baseline: dict = None) -> None:
+    header = f"{'students':>9} {'sites':>6}  {'stage':<28} {'seconds':>10} {'peak MB':>9}"
+    if baseline:
+        header += f" {'vs base':>8}"
+    print(header)
+    for r in rows:
+        peak = "" if r["peak_mb"] is None else f"{r['peak_mb']:.1f}"
+        line = f"{r['students']:>9} {r['sites']:>6}  {r['stage']:<28} {r['seconds']:>10.4f} {peak:>9}"
+        if baseline:
+            old = baseline.get((r["students"], r["sites"], r["stage"]))
+            line += f" {r['seconds'] / old:>7.2f}x" if old else f" {'-':>8}"
+        print(line)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="בדיקת ביצועים לשלבי השיבוץ")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="מספרי סטודנטים")
+    parser.add_argument("--sites-ratio", type=float, default=0.1, help="אתרים לכל סטודנט/ית (ברירת מחדל 0.1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="כמה פעמים להריץ כל גודל (נשמר הזמן הטוב ביותר)")
+    parser.add_argument("--no-memory", action="store_true", help="לדלג על מדידת שיא הזיכרון")
+    parser.add_argument("--output", help="קובץ JSON לתוצאות (ברירת מחדל: benchmarks/results/bench-<זמן>.json)")
+    parser.add_argument("--compare", help="קובץ JSON מהרצה קודמת להשוואה")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for n in args.sizes:
+        n_sites = max(10, int(round(n * args.sites_ratio)))
+        print(f"… {n} סטודנטים × {n_sites} אתרים", file=sys.stderr)
+        rows.extend(bench_size(n, n_sites, args.seed, args.repeat, memory=not args.no_memory))
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": rows,
+    }
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            old = json.load(fh)
+        baseline = {(r["students"], r["sites"], r["stage"]): r["seconds"] for r in old["results"]}
+    print_table(rows, baseline)
+    print(f"\nנשמר: {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
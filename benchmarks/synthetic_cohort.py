@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+מחולל מחזורים סינתטיים לבדיקות ביצועים.
+
+מייצר קובצי סטודנטים ואתרים עם אותן כותרות בעברית שהמערכת מזהה (STU_COLS / SITE_COLS):
+כמה תחומים מועדפים לכל סטודנט/ית, בקשות "קרוב לבית" / "אזור צפון",
+קיבולות מוטות (רוב האתרים קטנים, מעטים גדולים) ומדריכים שחלקם אחראים על כמה אתרים.
+"""
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+CITIES = [
+    "תל אביב", "ירושלים", "חיפה", "באר שבע", "ראשון לציון", "פתח תקווה", "נתניה", "אשדוד",
+    "חולון", "רמת גן", "רחובות", "הרצליה", "כפר סבא", "מודיעין", "לוד", "רמלה", "עפולה",
+    "נצרת", "צפת", "כרמיאל", "נהריה", "עכו", "קריית שמונה", "טבריה", "חורפיש", "אילת",
+]
+# משקל לכל עיר – ערים גדולות נפוצות יותר
+CITY_WEIGHTS = np.array([14, 12, 10, 8, 7, 6, 6, 6, 5, 5, 4, 4, 4, 3, 3, 3, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1], dtype=float)
+
+FIELDS = [
+    "בריאות הנפש", "רווחה", "חינוך מיוחד", "שיקום", "קהילה", "זקנה", "נוער בסיכון",
+    "משפחה וילדים", "התמכרויות", "בריאות", "מוגבלויות", "אלימות במשפחה",
+]
+FIELD_SUFFIXES = ["", "", "", " – מבוגרים", " – ילדים ונוער", " ומשפחה"]
+
+SPECIAL_REQUESTS = ["קרוב לבית", "אזור צפון", "מעדיפה קרוב לבית", "צפון בלבד", "ימי שלישי בלבד"]
+
+FIRST_NAMES = ["רות", "יואב", "סמאח", "נועה", "מוחמד", "אביגיל", "דניאל", "מאיה", "עומר", "ליאן", "תמר", "איתי"]
+LAST_NAMES = ["כהן", "לוי", "ח'ורי", "מזרחי", "אבו סאלח", "פרץ", "ביטון", "חסון", "דהן", "עזאם", "פרידמן", "אגבריה"]
+
+
+def _cities(rng: np.random.Generator, n: int) -> np.ndarray:
+    return rng.choice(CITIES, size=n, p=CITY_WEIGHTS / CITY_WEIGHTS.sum())
+
+
+def generate_students(n: int, seed: int = 0, special_rate: float = 0.35) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cities = _cities(rng, n)
+
+    # 0–3 תחומים, מופרדים ב-";" או "," כמו בקבצים אמיתיים
+    n_prefs = rng.choice([0, 1, 2, 3], size=n, p=[0.1, 0.35, 0.35, 0.2])
+    seps = rng.choice(["; ", ", "], size=n)
+    prefs = [sep.join(rng.choice(FIELDS, size=k, replace=False)) for k, sep in zip(n_prefs, seps)]
+
+    has_req = rng.random(n) < special_rate
+    reqs = np.where(has_req, rng.choice(SPECIAL_REQUESTS, size=n, p=[0.45, 0.3, 0.1, 0.1, 0.05]), "")
+
+    ids = 100_000_000 + rng.choice(900_000_000, size=n, replace=False)
+    first = rng.choice(FIRST_NAMES, size=n)
+    last = rng.choice(LAST_NAMES, size=n)
+    return pd.DataFrame({
+        "שם פרטי": first,
+        "שם משפחה": last,
+        "מספר תעודת זהות": ids.astype(str),
+        "כתובת": [f"רחוב {k % 97 + 1} {k % 40 + 1}, {c}" for k, c in enumerate(cities)],
+        "עיר מגורים": cities,
+        "טלפון": [f"05{rng.integers(0, 9)}{rng.integers(1_000_000, 9_999_999)}" for _ in range(n)],
+        "דוא\"ל": [f"student{k}@example.com" for k in range(n)],
+        "תחום מועדף": prefs,
+        "בקשה מיוחדת": reqs,
+        "בן/בת זוג להכשרה": "",
+    })
+
+
+def generate_sites(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed + 1)
+    cities = _cities(rng, n)
+    fields = [f + s for f, s in zip(rng.choice(FIELDS, size=n), rng.choice(FIELD_SUFFIXES, size=n))]
+
+    # קיבולת מוטה: רוב האתרים 1–2, מעטים עד 12
+    capacity = np.minimum(rng.zipf(2.2, size=n), 12)
+
+    # מדריכים: חלק אחראים על כמה אתרים, ולחלק מהאתרים אין מדריך רשום
+    n_sup = max(1, int(n * 0.7))
+    sup_idx = np.minimum(rng.zipf(1.6, size=n) - 1, n_sup - 1)
+    sup_idx = rng.permutation(n_sup)[sup_idx]
+    no_sup = rng.random(n) < 0.05
+    sup_first = np.where(no_sup, "", rng.choice(FIRST_NAMES, size=n_sup)[sup_idx])
+    sup_last = np.where(no_sup, "", np.char.add(rng.choice(LAST_NAMES, size=n_sup)[sup_idx],
+                                                 np.char.add(" ", sup_idx.astype(str))))
+    return pd.DataFrame({
+        "מוסד / שירות הכשרה": [f"{f.split(' ')[0]} {c} {k}" for k, (f, c) in enumerate(zip(fields, cities))],
+        "תחום ההתמחות": fields,
+        "רחוב": [f"הרצל {k % 120 + 1}" for k in range(n)],
+        "עיר": cities,
+        "מספר סטודנטים שניתן לקלוט השנה": capacity,
+        "שם פרטי": sup_first,
+        "שם משפחה": sup_last,
+        "טלפון": [f"0{rng.integers(2, 9)}{rng.integers(1_000_000, 9_999_999)}" for _ in range(n)],
+        "אימייל": [f"site{k}@example.org" for k in range(n)],
+        "חוות דעת מדריך": rng.choice(["", "מדריך/ה מנוסה, ליווי צמוד", "מתאים לסטודנטים בשנה ב'"], size=n),
+    })
+
+
+def generate_cohort(n_students: int, n_sites: int = 0, seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """מחזור שלם. ברירת מחדל: אתר אחד לכל 10 סטודנטים."""
+    n_sites = n_sites or max(10, n_students // 10)
+    return generate_students(n_students, seed), generate_sites(n_sites, seed)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+שיבוץ של כמה מחזורים (מחלקה/שנה) מהשורה, בלי Flask.
+
+    python cli.py cohorts/ -o out/                    # תיקייה עם תת-תיקייה לכל מחזור
+    python cli.py manifest.csv -o out/ --workers 4    # קובץ מניפסט: cohort,students,sites
+    python cli.py cohorts/ -o out/ --mode optimal --formats xlsx csv
+    python cli.py cohorts/ -o out/ --history runs.sqlite     # גם להיסטוריית הריצות
+
+בכל תת-תיקייה מחפשים קובץ סטודנטים (students* / student* / סטודנטים*) וקובץ אתרים
+(sites* / site* / אתרים*), xlsx/xls/csv. נתיבים במניפסט יחסיים לתיקיית המניפסט.
+לכל מחזור נכתבת תיקייה out/<cohort>/ עם הטבלאות ו-report.json, ובשורש out/ קובץ
+timings.json עם זמני השלבים לכל מחזור ובסך הכול.
+
+pandas / xlsxwriter נטענים רק בתהליכי העבודה (דרך placement), כך שהפעלת הכלי מהירה.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+TABLE_EXTENSIONS = (".xlsx", ".xls", ".csv")
+STUDENT_PREFIXES = ("students", "student", "סטודנטים")
+SITE_PREFIXES = ("sites", "site", "אתרים")
+CLI_MODES = ("greedy", "optimal")
+CLI_FORMATS = ("xlsx", "csv", "parquet")
+
+
+@dataclass
+class Cohort:
+    name: str
+    students: str
+    sites: str
+
+
+def _find_table(folder: str, prefixes: Sequence[str]) -> Optional[str]:
+    for entry in sorted(os.listdir(folder)):
+        stem, ext = os.path.splitext(entry)
+        if ext.lower() in TABLE_EXTENSIONS and stem.lower().startswith(prefixes):
+            return os.path.join(folder, entry)
+    return None
+
+
+def _check_cohort_name(name: str) -> None:
+    # שם המחזור הופך לתיקייה תחת out/ – לא מאפשרים לו לצאת ממנה
+    if not name or name == "." or ".." in name or "/" in name or "\\" in name:
+        raise ValueError(f"שם מחזור לא תקין במניפסט: {name!r}")
+
+
+def discover_cohorts(path: str) -> List[Cohort]:
+    """מחזורים מקובץ מניפסט (CSV) או מתיקייה של תת-תיקיות."""
+    if os.path.isfile(path):
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, encoding="utf-8-sig", newline="") as fh:
+            rows = list(csv.DictReader(fh))
+        missing = {"cohort", "students", "sites"} - set(rows[0] if rows else ())
+        if missing:
+            raise ValueError(f"במניפסט חסרות העמודות: {', '.join(sorted(missing))}")
+        cohorts = [Cohort(r["cohort"].strip(),
+                          os.path.join(base, r["students"].strip()),
+                          os.path.join(base, r["sites"].strip())) for r in rows]
+        for cohort in cohorts:
+            _check_cohort_name(cohort.name)
+        return cohorts
+
+    if not os.path.isdir(path):
+        raise ValueError(f"לא נמצא קובץ או תיקייה: {path}")
+    cohorts = []
+    for entry in sorted(os.scandir(path), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        students = _find_table(entry.path, STUDENT_PREFIXES)
+        sites = _find_table(entry.path, SITE_PREFIXES)
+        if students and sites:
+            cohorts.append(Cohort(entry.name, students, sites))
+        else:
+            print(f"דילוג על {entry.name}: חסר קובץ סטודנטים או אתרים", file=sys.stderr)
+    return cohorts
+
+
+def run_cohort(cohort: Cohort, out_root: str, mode: str, formats: Sequence[str],
+               history_path: str = "") -> dict:
+    """מריץ מחזור אחד (בתהליך עבודה). שגיאה לא מפילה את שאר המחזורים – היא נרשמת בתוצאה."""
+    t0 = time.perf_counter()
+    try:
+        import placement  # טעינה עצלה של pandas/numpy בתהליך העבודה
+        timings = placement.StageTimings()
+        timings.add("import", time.perf_counter() - t0)
+        history = None
+        if history_path:
+            from run_history import RunHistory
+            history = RunHistory(history_path)
+        report = placement.run_pipeline(cohort.students, cohort.sites,
+                                        os.path.join(out_root, cohort.name),
+                                        mode=mode, formats=formats, timings=timings, history=history)
+    except Exception as e:
+        return {"cohort": cohort.name, "state": "failed", "error": f"{type(e).__name__}: {e}",
+                "seconds": time.perf_counter() - t0}
+    return {"cohort": cohort.name, "state": "done", "seconds": time.perf_counter() - t0,
+            "rows": report["rows"], "assigned": report.get("assigned"), "run_id": report.get("run_id"),
+            "timings": report["timings"]}
+
+
+def run_batch(cohorts: Sequence[Cohort], out_root: str, mode: str = "greedy",
+              formats: Sequence[str] = ("xlsx",), workers: int = 0, history_path: str = "") -> dict:
+    """כל המחזורים במקביל. workers=1 – באותו תהליך; 0 – לפי מספר המעבדים."""
+    os.makedirs(out_root, exist_ok=True)
+    t0 = time.perf_counter()
+    workers = workers or min(len(cohorts), os.cpu_count() or 1) or 1
+    results = []
+    if workers == 1:
+        for cohort in cohorts:
+            results.append(run_cohort(cohort, out_root, mode, formats, history_path))
+            _print_result(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_cohort, c, out_root, mode, formats, history_path): c for c in cohorts}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # תהליך העבודה מת (למשל OOM -> BrokenProcessPool) – המחזור נכשל, השאר ממשיכים
+                    results.append({"cohort": futures[future].name, "state": "failed",
+                                    "error": f"{type(e).__name__}: {e}", "seconds": time.perf_counter() - t0})
+                _print_result(results[-1])
+    order = {c.name: i for i, c in enumerate(cohorts)}
+    results.sort(key=lambda r: order[r["cohort"]])
+
+    totals = {}
+    for r in results:
+        for stage, sec in r.get("timings", {}).items():
+            totals[stage] = totals.get(stage, 0.0) + sec
+    summary = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": mode,
+        "formats": list(formats),
+        "workers": workers,
+        "wall_seconds": time.perf_counter() - t0,
+        "cohorts": results,
+        "stage_totals": totals,
+        "failed": [r["cohort"] for r in results if r["state"] == "failed"],
+    }
+    with open(os.path.join(out_root, "timings.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=2)
+    return summary
+
+
+def _print_result(result: dict) -> None:
+    if result["state"] == "done":
+        print(f"✓ {result['cohort']}: {result['seconds']:.2f}s", file=sys.stderr)
+    else:
+        print(f"✗ {result['cohort']}: {result['error']}", file=sys.stderr)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="שיבוץ של כמה מחזורים בלי שרת")
+    parser.add_argument("source", help="תיקייה עם תת-תיקייה לכל מחזור, או מניפסט CSV (cohort,students,sites)")
+    parser.add_argument("-o", "--output", required=True, help="תיקיית פלט")
+    parser.add_argument("--mode", choices=CLI_MODES, default="greedy")
+    parser.add_argument("--workers", type=int, default=0, help="מספר תהליכים (ברירת מחדל: לפי המעבדים)")
+    parser.add_argument("--formats", nargs="+", choices=CLI_FORMATS, default=["xlsx"])
+    parser.add_argument("--history", default="", help="קובץ SQLite לשמירת הריצות (ראו run_history.py)")
+    args = parser.parse_args(argv)
+
+    try:
+        cohorts = discover_cohorts(args.source)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not cohorts:
+        print("לא נמצאו מחזורים", file=sys.stderr)
+        return 2
+    names = [c.name for c in cohorts]
+    if len(set(names)) != len(names):
+        print("שמות מחזורים כפולים במניפסט", file=sys.stderr)
+        return 2
+
+    summary = run_batch(cohorts, args.output, args.mode, args.formats, args.workers, args.history)
+    print(f"{len(cohorts) - len(summary['failed'])}/{len(cohorts)} מחזורים, "
+          f"{summary['wall_seconds']:.2f}s – {os.path.join(args.output, 'timings.json')}", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+מאגר יישובים (gazetteer) מקומי, בלי שירות חיצוני.
+
+הקובץ data/israel_localities.csv מכיל לכל יישוב: שם, קואורדינטות, מחוז וכינויים (מופרדים ב-|).
+בטעינה כל יישוב מקבל מזהה שלם, מחושבת מטריצת מרחקים בין כל זוגות היישובים (ק"מ),
+ונבנה אינדקס רשת לשאילתות "בטווח X ק"מ". איות שכבר נראה נשמר במטמון חסום (LOOKUP_CACHE_SIZE).
+"""
+import csv
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "israel_localities.csv")
+EARTH_RADIUS_KM = 6371.0
+GRID_DEGREES = 0.25  # גודל תא ברשת (~25–28 ק"מ)
+# כמה איותים שונים נשמרים ל-lookup; גם קלט חופשי מה-API עובר כאן, ולכן המטמון חסום
+LOOKUP_CACHE_SIZE = 4096
+
+_QUOTES = str.maketrans({"״": '"', "“": '"', "”": '"', "׳": "'", "`": "'", "’": "'"})
+_DASHES = re.compile(r"[-–—־]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_place(name: str) -> str:
+    """צורה אחידה לשם יישוב: גרשיים/מקפים/רווחים אחידים, "קרית" -> "קריית"."""
+    text = str(name or "").translate(_QUOTES).lower()
+    text = _SPACES.sub(" ", _DASHES.sub(" ", text)).strip()
+    return re.sub(r"^קרית ", "קריית ", text)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class Gazetteer:
+    """
+    טבלת יישובים ממוזהים. lookup(name) מחזיר מזהה יישוב או -1 (לא מוכר).
+    distance היא מטריצת float32 בגודל (יישובים, יישובים) בק"מ.
+    """
+
+    def __init__(self, names: Sequence[str], lat: Sequence[float], lon: Sequence[float],
+                 regions: Sequence[str], aliases: Sequence[Iterable[str]] = ()):
+        self.names: List[str] = list(names)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.regions: List[str] = list(regions)
+
+        self._ids: Dict[str, int] = {}
+        for city_id, name in enumerate(self.names):
+            self._ids.setdefault(normalize_place(name), city_id)
+        for city_id, names_of in enumerate(aliases):
+            for alias in names_of:
+                self._ids.setdefault(normalize_place(alias), city_id)
+        self._cached_lookup = lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._resolve)
+
+        self.distance = haversine_km(self.lat[:, None], self.lon[:, None],
+                                     self.lat[None, :], self.lon[None, :]).astype(np.float32)
+
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for city_id, cell in enumerate(zip(*self._cells(self.lat, self.lon))):
+            self._grid.setdefault(cell, []).append(city_id)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_GAZETTEER_PATH) -> "Gazetteer":
+        names, lat, lon, regions, aliases = [], [], [], [], []
+        with open(path, encoding="utf-8-sig", newline="") as fh:
+            for row in csv.DictReader(fh):
+                names.append(row["name"].strip())
+                lat.append(float(row["lat"]))
+                lon.append(float(row["lon"]))
+                regions.append(row["region"].strip())
+                aliases.append([a for a in (row.get("aliases") or "").split("|") if a.strip()])
+        return cls(names, lat, lon, regions, aliases)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # ---------- זיהוי שמות ----------
+    def _resolve(self, key: str) -> int:
+        return self._ids.get(normalize_place(key), -1)
+
+    def lookup(self, name: str) -> int:
+        """מזהה היישוב (או -1). איותים חוזרים נענים מהמטמון (LRU, עד LOOKUP_CACHE_SIZE)."""
+        return self._cached_lookup(str(name or ""))
+
+    def ids(self, names: Iterable[str]) -> np.ndarray:
+        return np.array([self.lookup(n) for n in names], dtype=np.int64)
+
+    def region(self, name: str) -> str:
+        city_id = self.lookup(name)
+        return self.regions[city_id] if city_id >= 0 else ""
+
+    # ---------- מרחקים ----------
+    @staticmethod
+    def _cells(lat, lon):
+        return (np.floor(np.asarray(lat) / GRID_DEGREES).astype(int),
+                np.floor(np.asarray(lon) / GRID_DEGREES).astype(int))
+
+    def near(self, lat: float, lon: float, km: float) -> np.ndarray:
+        """מזהי היישובים בטווח km מהנקודה, ממוינים לפי מרחק. נבדקים רק תאי הרשת שבטווח."""
+        dlat = km / 111.0
+        dlon = km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        (lat0, lat1), (lon0, lon1) = self._cells([lat - dlat, lat + dlat], [lon - dlon, lon + dlon])
+        candidates = [city_id
+                      for i in range(lat0, lat1 + 1)
+                      for j in range(lon0, lon1 + 1)
+                      for city_id in self._grid.get((i, j), ())]
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.array(candidates, dtype=np.int64)
+        dist = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        inside = dist <= km
+        return candidates[inside][np.argsort(dist[inside], kind="stable")]
+
+    def within(self, name: str, km: float) -> List[Tuple[str, float]]:
+        """היישובים בטווח km מיישוב לפי שם: [(שם, מרחק)], מהקרוב לרחוק. שם לא מוכר -> KeyError."""
+        city_id = self.lookup(name)
+        if city_id < 0:
+            raise KeyError(name)
+        found = self.near(self.lat[city_id], self.lon[city_id], km)
+        return [(self.names[k], round(float(self.distance[city_id, k]), 1)) for k in found]
+
+    def band_matrix(self, bands: Sequence[Tuple[float, int]], beyond: int = 0) -> np.ndarray:
+        """
+        ערך לכל זוג יישובים לפי רצועות מרחק: bands = [(עד ק"מ, ערך), ...] בסדר עולה;
+        זוג רחוק מהרצועה האחרונה מקבל beyond. מחושב פעם אחת, כך שכל זוג הוא גישה למטריצה.
+        """
+        limits = np.array([limit for limit, _ in bands], dtype=np.float64)
+        values = np.array([value for _, value in bands] + [beyond], dtype=np.uint8)
+        return values[np.searchsorted(limits, self.distance.astype(np.float64), side="left")]
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+קריאת קובצי סטודנטים / אתרים: קודם שורת הכותרות, ואז רק העמודות שהשיבוץ צריך.
+
+read_header מחזיר את הכותרות בלי לקרוא את גוף הקובץ, כך שעמודה חסרה מתגלה מיד
+(עוד לפני שהעבודה נכנסת לתור). read_columns קורא רק את העמודות שנבחרו, כולן כטקסט
+(None לתא ריק) – בלי ניחוש טיפוסים, כך שת"ז עם אפס מוביל נשאר כמו שהוא.
+
+ל-xlsx: אם python-calamine מותקן משתמשים בו; אחרת קורא זורם משלנו (zipfile + iterparse)
+שמפענח רק את התאים של העמודות שנבחרו. xls ישן עובר דרך pandas.
+"""
+import importlib.util
+import zipfile
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+from xml.etree.ElementTree import iterparse
+
+import pandas as pd
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_DIGITS = "0123456789"
+
+
+class MissingColumnsError(ValueError):
+    """בקובץ חסרות עמודות חובה. missing: שם שדה -> הכותרות שמתקבלות עבורו."""
+
+    def __init__(self, kind: str, missing: Dict[str, List[str]], header: Sequence[str]):
+        self.kind = kind
+        self.missing = missing
+        self.header = list(header)
+        lines = [f"בקובץ ה{kind} חסרות עמודות חובה:"]
+        lines += [f"• {field}: אחת מ- {' / '.join(aliases)}" for field, aliases in missing.items()]
+        found = ", ".join(h for h in self.header if h) or "(אין)"
+        lines.append(f"הכותרות שנמצאו בקובץ: {found}")
+        super().__init__("\n".join(lines))
+
+
+def _kind(filename: str) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".xlsx"):
+        return "xlsx"
+    if name.endswith(".xls"):
+        return "xls"
+    return "csv"
+
+
+def _rewind(stream):
+    """קובץ פתוח חוזר להתחלה; נתיב (str) מוחזר כמו שהוא."""
+    if hasattr(stream, "seek"):
+        stream.seek(0)
+    return stream
+
+
+def _calamine_available() -> bool:
+    return importlib.util.find_spec("python_calamine") is not None
+
+
+# ---------- xlsx זורם ----------
+@lru_cache(maxsize=1024)
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n - 1
+
+
+def _first_sheet_path(zf: zipfile.ZipFile) -> str:
+    try:
+        with zf.open("xl/workbook.xml") as fh:
+            for _, el in iterparse(fh):
+                if el.tag == _NS + "sheet":
+                    rel_id = el.get(_REL_NS + "id")
+                    break
+            else:
+                return "xl/worksheets/sheet1.xml"
+        with zf.open("xl/_rels/workbook.xml.rels") as fh:
+            for _, el in iterparse(fh):
+                if el.tag == _PKG_REL_NS + "Relationship" and el.get("Id") == rel_id:
+                    target = el.get("Target").lstrip("/")
+                    return target if target.startswith("xl/") else "xl/" + target
+    except KeyError:
+        pass
+    return "xl/worksheets/sheet1.xml"
+
+
+def _shared_strings(zf: zipfile.ZipFile, limit: Optional[int] = None) -> List[str]:
+    """טבלת המחרוזות המשותפות; עם limit – רק עד האינדקס הזה (מספיק לשורת הכותרות)."""
+    try:
+        fh = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    strings = []
+    with fh:
+        for _, el in iterparse(fh):
+            if el.tag == _NS + "si":
+                # טקסט עשיר: כל ה-<t> של הריצות, בלי ההגייה (rPh)
+                strings.append("".join(t.text or "" for child in el
+                                       if child.tag in (_NS + "t", _NS + "r")
+                                       for t in child.iter(_NS + "t")))
+                el.clear()
+                if limit is not None and len(strings) > limit:
+                    break
+    return strings
+
+
+def _cell_text(cell, strings: List[str]) -> Optional[str]:
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(_NS + "t"))
+    v = cell.find(_NS + "v")
+    if v is None or v.text is None:
+        return None
+    if kind == "s":
+        return strings[int(v.text)]
+    if kind == "b":
+        return "True" if v.text == "1" else "False"
+    if kind == "n":
+        # מספר שלם נשמר ב-Excel כ-"123" או "1.23E+8" – מחזירים בלי ".0"
+        try:
+            number = float(v.text)
+        except ValueError:
+            return v.text
+        if number.is_integer() and abs(number) < 1e15:
+            return str(int(number))
+    return v.text
+
+
+def _row_cells(row, wanted=None):
+    """(אינדקס עמודה, תא) לכל תא בשורה; wanted – רק העמודות האלה."""
+    pos = 0
+    for cell in row.iter(_NS + "c"):
+        ref = cell.get("r")
+        idx = _col_index(ref.rstrip(_DIGITS)) if ref else pos
+        pos = idx + 1
+        if wanted is None or idx in wanted:
+            yield idx, cell
+
+
+def _xlsx_header(source) -> List[str]:
+    """שורת הכותרות בלבד: עוצרים אחרי השורה הראשונה, ומהמחרוזות המשותפות קוראים רק עד הנדרש."""
+    with zipfile.ZipFile(_rewind(source)) as zf:
+        with zf.open(_first_sheet_path(zf)) as fh:
+            for _, el in iterparse(fh):
+                if el.tag == _NS + "row":
+                    cells = list(_row_cells(el))
+                    break
+            else:
+                return []
+        shared = [int(c.find(_NS + "v").text) for _, c in cells
+                  if c.get("t") == "s" and c.find(_NS + "v") is not None]
+        strings = _shared_strings(zf, max(shared)) if shared else []
+        values = {idx: _cell_text(c, strings) for idx, c in cells}
+    width = max(values, default=-1) + 1
+    return [values.get(i) or "" for i in range(width)]
+
+
+def _xlsx_columns(source, columns: List[str]) -> pd.DataFrame:
+    """גוף הגיליון הראשון, רק לעמודות ב-columns; כל שאר התאים לא מפוענחים."""
+    index_of = {name: i for i, name in enumerate(_dedupe(_xlsx_header(source)))}
+    wanted = [index_of[c] for c in columns]
+    wanted_set = set(wanted)
+    cols = {idx: [] for idx in wanted}
+    with zipfile.ZipFile(_rewind(source)) as zf:
+        strings = _shared_strings(zf)
+        with zf.open(_first_sheet_path(zf)) as fh:
+            n_rows = last_filled = 0
+            next_row = None
+            for _, el in iterparse(fh):
+                if el.tag != _NS + "row":
+                    continue
+                row_number = int(el.get("r", 0)) or (next_row or 1)
+                if next_row is None:  # שורת הכותרות
+                    next_row = row_number + 1
+                    el.clear()
+                    continue
+                # שורות ריקות באמצע לא נכתבות לקובץ – משלימים כדי לשמור על המיקום
+                for _ in range(row_number - next_row):
+                    for out in cols.values():
+                        out.append(None)
+                    n_rows += 1
+                next_row = row_number + 1
+                values = {}
+                for idx, cell in _row_cells(el, wanted_set):
+                    text = _cell_text(cell, strings)
+                    if text:
+                        values[idx] = text
+                for idx, out in cols.items():
+                    out.append(values.get(idx))
+                n_rows += 1
+                if values:
+                    last_filled = n_rows
+                el.clear()
+    # שורות ריקות בסוף הגיליון מושמטות, כמו ב-pandas
+    return pd.DataFrame({name: pd.Series(cols[idx][:last_filled], dtype=object)
+                         for name, idx in zip(columns, wanted)}, columns=columns)
+
+
+def _dedupe(header: List[str]) -> List[str]:
+    """כמו pandas: כותרת כפולה מקבלת סיומת .1, .2 ... וכותרת ריקה – Unnamed: <מיקום>."""
+    seen, out = {}, []
+    for i, name in enumerate(header):
+        name = str(name) if name not in (None, "") else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        out.append(name)
+    return out
+
+
+# ---------- ממשק ----------
+def read_header(stream, filename: str) -> List[str]:
+    """כותרות העמודות בלבד (שמות כמו ש-pandas היה נותן להן)."""
+    kind = _kind(filename)
+    if kind == "xlsx":
+        return _dedupe(_xlsx_header(stream))
+    if kind == "xls":
+        return [str(c) for c in pd.read_excel(_rewind(stream), nrows=0).columns]
+    return [str(c) for c in pd.read_csv(_rewind(stream), encoding="utf-8-sig", nrows=0).columns]
+
+
+def read_columns(stream, filename: str, columns: Sequence[str]) -> pd.DataFrame:
+    """
+    רק העמודות ב-columns (שמות מתוך read_header), כולן כטקסט; תא ריק -> None.
+    שורות ריקות בסוף הקובץ מושמטות, כמו ב-pandas.
+    """
+    kind = _kind(filename)
+    columns = list(dict.fromkeys(columns))
+    if kind == "csv":
+        return pd.read_csv(_rewind(stream), encoding="utf-8-sig", usecols=columns, dtype=str)[columns]
+    if kind == "xls" or _calamine_available():
+        engine = "calamine" if kind == "xlsx" else None
+        return pd.read_excel(_rewind(stream), usecols=columns, dtype=str, engine=engine)[columns]
+    return _xlsx_columns(stream, columns)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+ריצות שיבוץ אסינכרוניות.
+
+הבקשה רק שולחת את הקבצים לתור ומקבלת מזהה עבודה (job id); השיבוץ עצמו רץ
+ב-ProcessPoolExecutor. מצב העבודה (כולל התקדמות) נכתב לקובץ JSON בתיקייה
+משותפת, כך שכל worker של gunicorn יכול לענות על בקשת סטטוס.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+JOB_STATES = ("queued", "running", "done", "failed")
+DEFAULT_JOBS_DIR = os.path.join(tempfile.gettempdir(), "placement_jobs")
+
+
+class QueueFull(Exception):
+    """התור מלא – לא מקבלים עבודה חדשה עד שאחת תסתיים."""
+
+
+class JobStatus:
+    """קריאה/כתיבה של קובץ הסטטוס של עבודה. משמש גם בתהליך הראשי וגם בתהליכי העבודה."""
+
+    def __init__(self, root: str, job_id: str):
+        if not job_id or not all(ch in "0123456789abcdef" for ch in job_id):
+            raise KeyError(job_id)
+        self.path = os.path.join(root, f"{job_id}.json")
+        self.root = root
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    def write(self, **fields) -> None:
+        current = self.read() or {"job_id": self.job_id, "created_at": time.time()}
+        current.update(fields)
+        current["updated_at"] = time.time()
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=self.root)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(current, fh, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self._last_write = current["updated_at"]
+
+    def progress(self, done: int, total: int, min_interval: float = 0.25) -> None:
+        # מצמצמים כתיבות לדיסק בלולאות צפופות
+        if done < total and time.time() - self._last_write < min_interval:
+            return
+        self.write(progress={"done": int(done), "total": int(total)})
+
+    def read(self) -> Optional[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+
+def _run_job(fn: Callable, root: str, job_id: str, args: tuple, kwargs: dict) -> None:
+    status = JobStatus(root, job_id)
+    status.write(state="running", started_at=time.time())
+    try:
+        fn(job_id, status, *args, **kwargs)
+    except Exception as e:
+        status.write(state="failed", error=str(e), traceback=traceback.format_exc(limit=5))
+    else:
+        status.write(state="done", finished_at=time.time())
+
+
+class JobManager:
+    """
+    מריץ עבודות ב-ProcessPoolExecutor עם תור חסום: עד max_pending עבודות (ממתינות + רצות)
+    לכל תהליך שרת. הפונקציה שמועברת ל-submit חייבת להיות ברמת מודול (pickle),
+    ומקבלת (job_id, status, *args) – status.progress(done, total) מדווח התקדמות.
+    on_finish(status_dict), אם הועבר, נקרא בתהליך השרת כשעבודה מסתיימת (למשל לעדכון מדדים).
+    """
+
+    def __init__(self, root: str, max_workers: int = 2, max_pending: int = 8,
+                 ttl_seconds: int = 6 * 3600, on_finish: Optional[Callable[[dict], None]] = None):
+        self.root = root
+        self.on_finish = on_finish
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # נוצר בעצלות – כל worker של gunicorn מקבל pool משלו אחרי ה-fork
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        # pool שתהליך בו מת (OOM, kill) לא מקבל עוד עבודות – ה-submit הבא יבנה חדש
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _finished(self, job_id: str, pool: ProcessPoolExecutor, future) -> None:
+        self._release(None)
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            # _run_job לא הספיק לכתוב סטטוס (התהליך נהרג, pickle נכשל וכו')
+            if isinstance(error, BrokenProcessPool):
+                self._discard_pool(pool)
+            JobStatus(self.root, job_id).write(state="failed", error=str(error) or type(error).__name__,
+                                               finished_at=time.time())
+        if self.on_finish is not None:
+            status = self.status(job_id)
+            if status is not None:
+                self.on_finish(status)
+
+    def submit(self, job_id: str, fn: Callable, *args, **kwargs) -> str:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(job_id)
+            self._pending += 1
+        try:
+            JobStatus(self.root, job_id).write(state="queued")
+            pool = self._executor()
+            try:
+                future = pool.submit(_run_job, fn, self.root, job_id, args, kwargs)
+            except BrokenProcessPool:
+                self._discard_pool(pool)
+                pool = self._executor()
+                future = pool.submit(_run_job, fn, self.root, job_id, args, kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(lambda f: self._finished(job_id, pool, f))
+        self.purge_expired()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        try:
+            return JobStatus(self.root, job_id).read()
+        except KeyError:
+            return None
+
+    def purge_expired(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                continue
@@ -0,0 +1,1648 @@
+# -*- coding: utf-8 -*-
+"""
+ליבת השיבוץ, בלי Flask: זיהוי עמודות, ניקוד, שיבוץ (חמדני / אופטימלי), השוואת משקלים,
+שיבוץ מחדש לפי שינויים, טבלאות סיכום ויצוא.
+
+app.py (האתר) ו-cli.py (שורת הפקודה) משתמשים במודול הזה. run_pipeline מריץ את כל
+השלבים על זוג קבצים אחד: resolve -> match -> summarize -> export.
+"""
+import copy
+import hashlib
+import json
+import os
+import uuid
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from gazetteer import DEFAULT_GAZETTEER_PATH, Gazetteer
+from ingest import MissingColumnsError, read_columns, read_header
+from metrics import StageTimings
+
+# ========= מודל ניקוד =========
+@dataclass
+class Weights:
+    w_field: float = 0.50   # תחום
+    w_city: float = 0.05    # עיר
+    w_special: float = 0.45 # בקשות מיוחדות
+
+# עמודות סטודנטים
+STU_COLS = {
+    "id": ["מספר תעודת זהות", "תעודת זהות", "ת\"ז", "תז", "תעודת זהות הסטודנט"],
+    "first": ["שם פרטי"],
+    "last": ["שם משפחה"],
+    # חדש – כתובת, למקרה שאין עמודת עיר
+    "address": ["כתובת", "כתובת מלאה", "כתובת הסטודנט"],
+    "city": ["עיר מגורים", "עיר"],
+    "phone": ["טלפון", "מספר טלפון"],
+    "email": ["דוא\"ל", "דוא״ל", "אימייל", "כתובת אימייל", "כתובת מייל"],
+    "preferred_field": ["תחום מועדף", "תחומים מועדפים"],
+    "special_req": ["בקשה מיוחדת"],
+    "partner": ["בן/בת זוג להכשרה", "בן\\בת זוג להכשרה", "בן/בת זוג", "בן\\בת זוג"]
+}
+
+# עמודות אתרים
+SITE_COLS = {
+    "name": ["מוסד / שירות הכשרה", "מוסד", "שם מוסד ההתמחות", "שם המוסד", "מוסד ההכשרה"],
+    "field": ["תחום ההתמחות", "תחום התמחות"],
+    "street": ["רחוב"],
+    "city": ["עיר"],
+    "capacity": ["מספר סטודנטים שניתן לקלוט השנה", "מספר סטודנטים שניתן לקלוט", "קיבולת"],
+    "sup_first": ["שם פרטי"],
+    "sup_last": ["שם משפחה"],
+    "phone": ["טלפון"],
+    "email": ["אימייל", "כתובת מייל", "דוא\"ל", "דוא״ל"],
+    "review": ["חוות דעת מדריך"]
+}
+
+# שדות שבלעדיהם אין שיבוץ, והשדות שנקראים מהקובץ בכלל (כל השאר לא נטענים)
+REQUIRED_STUDENT_FIELDS = ("id", "first", "last")
+REQUIRED_SITE_FIELDS = ("name", "field", "city")
+STUDENT_READ_FIELDS = ("id", "first", "last", "address", "city", "preferred_field", "special_req", "partner")
+SITE_READ_FIELDS = ("name", "field", "city", "capacity", "sup_first", "sup_last")
+
+# ========= פונקציות עזר =========
+def resolve_columns(header: Sequence[str], spec: Dict[str, List[str]]) -> Dict[str, str]:
+    """
+    כל השדות של spec (STU_COLS / SITE_COLS) במעבר אחד על הכותרות: שדה -> שם העמודה בקובץ.
+    כשכמה כינויים של אותו שדה מופיעים, הראשון ברשימה קודם; רווחים מסביב לכותרת לא משנים.
+    """
+    rank = {}
+    for field, options in spec.items():
+        for k, opt in enumerate(options):
+            rank.setdefault(opt, []).append((field, k))
+    best = {}
+    for col in header:
+        for field, k in rank.get(str(col).strip(), ()):
+            if field not in best or k < best[field][0]:
+                best[field] = (k, col)
+    return {field: col for field, (_, col) in best.items()}
+
+def check_columns(header: Sequence[str], kind: str) -> Dict[str, str]:
+    """resolve_columns + בדיקת שדות חובה. kind: "students" / "sites". חסר -> MissingColumnsError."""
+    spec, required, label = ((STU_COLS, REQUIRED_STUDENT_FIELDS, "סטודנטים") if kind == "students"
+                             else (SITE_COLS, REQUIRED_SITE_FIELDS, "אתרים"))
+    cols = resolve_columns(header, spec)
+    missing = {spec[f][0]: spec[f] for f in required if f not in cols}
+    if missing:
+        raise MissingColumnsError(label, missing, header)
+    return cols
+
+def _read_projected(stream, filename: str, kind: str, fields: Sequence[str]) -> pd.DataFrame:
+    cols = check_columns(read_header(stream, filename), kind)
+    return read_columns(stream, filename, [cols[f] for f in fields if f in cols])
+
+def read_students_table(stream, filename: str) -> pd.DataFrame:
+    """קובץ סטודנטים: בדיקת הכותרות ואז קריאה של העמודות ב-STUDENT_READ_FIELDS בלבד."""
+    return _read_projected(stream, filename, "students", STUDENT_READ_FIELDS)
+
+def read_sites_table(stream, filename: str) -> pd.DataFrame:
+    """קובץ אתרים: בדיקת הכותרות ואז קריאה של העמודות ב-SITE_READ_FIELDS בלבד."""
+    return _read_projected(stream, filename, "sites", SITE_READ_FIELDS)
+
+def normalize_text(x: Any) -> str:
+    if x is None or (isinstance(x, float) and np.isnan(x)):
+        return ""
+    return str(x).strip()
+
+def plain_text(values: pd.Series) -> list:
+    return [normalize_text(x) for x in values]
+
+def interned_text(values: pd.Series) -> pd.Categorical:
+    """
+    normalize_text על הערכים הייחודיים בלבד, והתוצאה כ-Categorical: קוד שלם לכל שורה
+    ומחרוזת אחת לכל ערך שונה (עיר / תחום / מדריך חוזרים על עצמם אלפי פעמים).
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    cleaned = np.array([normalize_text(u) for u in uniques] + [""], dtype=object)  # -1 (ריק) -> ""
+    cat_codes, categories = pd.factorize(cleaned)
+    return pd.Categorical.from_codes(cat_codes[codes], categories=categories)
+
+# --- סטודנטים ---
+# הטבלה המזוהה מכילה רק את העמודות שהשיבוץ והפלט צריכים, ולא עותק של כל הקובץ:
+# שדות ההתאמה (עיר / העדפה / בקשה) כ-Categorical, ושדות התצוגה (ת"ז / שם) כמחרוזות
+# שנקראות רק בבניית טבלת התוצאות.
+def resolve_students(df: pd.DataFrame) -> pd.DataFrame:
+    cols = check_columns(df.columns, "students")
+    out = pd.DataFrame(index=df.index)
+
+    out["stu_id"] = plain_text(df[cols["id"]])
+    out["stu_first"] = plain_text(df[cols["first"]])
+    out["stu_last"] = plain_text(df[cols["last"]])
+
+    # עיר – קודם מנסים עמודת "עיר", ואם אין – מחלצים מהכתובת (החלק אחרי הפסיק)
+    city_col = cols.get("city")
+    if city_col:
+        out["stu_city"] = interned_text(df[city_col])
+    else:
+        addr_col = cols.get("address")
+        if addr_col:
+            out["stu_city"] = interned_text(df[addr_col].apply(
+                lambda x: str(x).split(",")[-1].strip() if isinstance(x, str) and "," in x else ""
+            ))
+        else:
+            out["stu_city"] = interned_text(pd.Series("", index=df.index))
+
+    pref_col = cols.get("preferred_field")
+    out["stu_pref"] = interned_text(df[pref_col] if pref_col else pd.Series("", index=df.index))
+
+    req_col = cols.get("special_req")
+    out["stu_req"] = interned_text(df[req_col] if req_col else pd.Series("", index=df.index))
+
+    # בן/בת זוג להכשרה – ת"ז או שם מלא, כפי שנכתב בקובץ (ראו partner_pairs)
+    partner_col = cols.get("partner")
+    out["stu_partner"] = plain_text(df[partner_col]) if partner_col else ""
+
+    return out
+
+RESOLVED_STUDENT_COLS = ["stu_id", "stu_first", "stu_last", "stu_city", "stu_pref", "stu_req", "stu_partner"]
+
+# --- אתרים ---
+def resolve_sites(df: pd.DataFrame) -> pd.DataFrame:
+    cols = check_columns(df.columns, "sites")
+    out = pd.DataFrame(index=df.index)
+    out["site_name"] = plain_text(df[cols["name"]])
+    out["site_field"] = interned_text(df[cols["field"]])
+    out["site_city"] = interned_text(df[cols["city"]])
+
+    cap_col = cols.get("capacity")
+    if cap_col:
+        out["site_capacity"] = pd.to_numeric(df[cap_col], errors="coerce").fillna(1).astype(int)
+    else:
+        out["site_capacity"] = 1
+    out["capacity_left"] = out["site_capacity"].astype(int)
+
+    sup_first = cols.get("sup_first")
+    sup_last = cols.get("sup_last")
+    supervisor = pd.Series("", index=df.index)
+    if sup_first or sup_last:
+        # תא ריק -> "" (ולא "nan" / "None" בשם המדריך)
+        ff = df[sup_first].fillna("") if sup_first else ""
+        ll = df[sup_last].fillna("") if sup_last else ""
+        supervisor = (ff.astype(str) + " " + ll.astype(str)).str.strip()
+    out["שם המדריך"] = interned_text(supervisor)
+    return out
+
+RESOLVED_SITE_COLS = ["site_name", "site_field", "site_city", "site_capacity", "capacity_left", "שם המדריך"]
+
+# גרסת זיהוי העמודות – להעלות כשמשנים את resolve_* כדי לפסול את מטמון ההעלאות
+RESOLVE_VERSION = "4"
+
+# --- גיאוגרפיה: מאגר יישובים מקומי ---
+gazetteer = Gazetteer.load(os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH))
+# רכיב העיר לפי מרחק בין היישובים: (עד ק"מ, ערך); רחוק יותר -> 0. אותה עיר = 0 ק"מ = 100
+CITY_DISTANCE_BANDS = [(0.0, 100), (10.0, 85), (25.0, 60), (50.0, 30)]
+CITY_POINTS = gazetteer.band_matrix(CITY_DISTANCE_BANDS)
+NORTH_REGIONS = ("צפון",)
+# לפי מזהה יישוב; האיבר האחרון הוא ליישוב לא מוכר (מזהה -1)
+REGION_NORTH = np.array([r in NORTH_REGIONS for r in gazetteer.regions] + [False])
+
+def city_points(stu_city: str, site_city: str) -> int:
+    """
+    רכיב העיר לזוג אחד. עיר שאינה במאגר – אותה עיר בדיוק = 100, אחרת ניטרלי (50) כמו עיר חסרה:
+    לא מענישים סטודנט/ית או מוסד רק כי היישוב חסר בקובץ היישובים.
+    """
+    if not (stu_city and site_city):
+        return 50  # ניטרלי כשאין מידע מלא
+    a, b = gazetteer.lookup(stu_city), gazetteer.lookup(site_city)
+    if a >= 0 and b >= 0:
+        return int(CITY_POINTS[a, b])
+    return 100 if stu_city == site_city else 50
+
+def city_points_table(stu_cities: np.ndarray, site_cities: np.ndarray) -> np.ndarray:
+    """city_points לכל צירוף של ערים ייחודיות (סטודנטים × מוסדות), בבת אחת."""
+    stu_ids, site_ids = gazetteer.ids(stu_cities), gazetteer.ids(site_cities)
+    known = (stu_cities != "")[:, None] & (site_cities != "")[None, :]
+    located = (stu_ids >= 0)[:, None] & (site_ids >= 0)[None, :]
+    banded = CITY_POINTS[np.ix_(np.maximum(stu_ids, 0), np.maximum(site_ids, 0))]
+    same = stu_cities[:, None] == site_cities[None, :]
+    return np.where(known & (located | same), np.where(located, banded, 100), 50).astype(np.uint8)
+
+def unresolved_cities(students_df: pd.DataFrame, sites_df: pd.DataFrame) -> dict:
+    """שמות יישובים (לא ריקים) שלא נמצאו במאגר – לדוח הריצה, כדי שאפשר יהיה להשלים את הקובץ."""
+    def missing(df, col):
+        if col not in df.columns:
+            return []
+        names = pd.unique(df[col].astype(str).str.strip())
+        return sorted(n for n in names if n and gazetteer.lookup(normalize_text(n).lower()) < 0)
+    found = {"students": missing(students_df, "stu_city"), "sites": missing(sites_df, "site_city")}
+    return {k: v for k, v in found.items() if v}
+
+# --- ציון + פירוק לפי 50/45/5 ---
+
+def compute_score_with_explain(stu: pd.Series, site: pd.Series, W: Weights):
+    stu_city   = normalize_text(stu.get("stu_city", "")).lower()
+    site_city  = normalize_text(site.get("site_city", "")).lower()
+    stu_pref   = normalize_text(stu.get("stu_pref", "")).lower()
+    site_field = normalize_text(site.get("site_field", "")).lower()
+    stu_req    = normalize_text(stu.get("stu_req", ""))
+
+    # 1) תחום – 50%
+    # לסטודנט/ית יכולים להיות כמה תחומים: "רווחה; שיקום; קהילה"
+    if stu_pref:
+        tokens = [t.strip() for t in stu_pref.replace(";", ",").split(",") if t.strip()]
+        if tokens:
+            field_component = 100 if any(tok in site_field for tok in tokens) else 0
+        else:
+            field_component = 70
+    else:
+        field_component = 70  # ניטרלי חלקי כשאין העדפה בכלל
+
+    # 2) עיר – 5%, לפי רצועות מרחק (CITY_DISTANCE_BANDS)
+    city_component = city_points(stu_city, site_city)
+
+    # 3) בקשות מיוחדות – 45%
+    stu_req_lower = stu_req.lower()
+    # "קרוב לבית" – אותן רצועות מרחק; אם חסרה עיר – ניטרלי (לא מענישים על חוסר מידע)
+    if "קרוב" in stu_req_lower:
+        special_component = city_component
+    # "אזור צפון" – התאמה חלקית אם המוסד במחוז צפון
+    elif "צפון" in stu_req_lower:
+        if REGION_NORTH[gazetteer.lookup(site_city)]:
+            special_component = 75  # חלקי – בסביבות 80–85% יחד עם תחום
+        else:
+            special_component = 50
+    else:
+        # אין בקשה מיוחדת – ניטרלי
+        special_component = 50
+
+    parts = {
+        "התאמת תחום": round(W.w_field * field_component),
+        "מרחק/גיאוגרפיה": round(W.w_city * city_component),
+        "בקשות מיוחדות": round(W.w_special * special_component),
+        "עדיפויות הסטודנט/ית": 0
+    }
+    score = int(np.clip(sum(parts.values()), 0, 100))
+    return score, parts
+
+# ========= מנוע ניקוד וקטורי =========
+# מקודדים ערים/תחומים/בקשות פעם אחת ומחשבים את כל הזוגות סטודנט×אתר כמטריצות.
+SPECIAL_NONE, SPECIAL_NEAR, SPECIAL_NORTH = 0, 1, 2
+MAX_STUDENTS_PER_SUPERVISOR = 2
+
+def split_pref_tokens(pref: str) -> List[str]:
+    return [t.strip() for t in pref.replace(";", ",").split(",") if t.strip()]
+
+def _lower_codes(df: pd.DataFrame, col: str):
+    """
+    (קוד לכל שורה, ערכים ייחודיים באותיות קטנות). עובד על הקטגוריות עצמן כשהעמודה Categorical,
+    כך שהטקסט מנורמל פעם אחת לכל ערך שונה ולא פעם אחת לכל שורה.
+    """
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.int64), np.array([""], dtype=object)
+    values = df[col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    lowered = np.array([normalize_text(u).lower() for u in uniques] + [""], dtype=object)
+    # שני ערכים שונים יכולים להפוך לזהים אחרי lower/strip – מאחדים את הקודים
+    merged, lowered_uniques = pd.factorize(lowered)
+    return merged[np.asarray(codes, dtype=np.int64)], np.asarray(lowered_uniques, dtype=object)
+
+def _points_lut(weight: float) -> np.ndarray:
+    # רכיב הוא מספר שלם 0–100, לכן טבלת עיגול אחת נותנת בדיוק את round(w * c).
+    # int16 ולא int64: האינדוקס בטבלה יוצר מטריצה בגודל (סטודנטים, אתרים) מאותו dtype
+    return np.array([round(weight * v) for v in range(101)], dtype=np.int16)
+
+class FieldIndex:
+    """
+    אינדקס הפוך ממילת העדפה לתחומי המוסדות (הייחודיים) שמכילים אותה – אותה בדיקה בדיוק
+    כמו tok in site_field ב-compute_score_with_explain. כל התחומים משורשרים למחרוזת אחת,
+    כך שכל מילה נמצאת ב-str.find על פני המחרוזת במקום בדיקה נפרדת מול כל תחום,
+    והתוצאה נשמרת לכל מילה.
+    """
+    SEP = "\x00"
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self._text = self.SEP.join(self.fields)
+        self._starts = np.cumsum([0] + [len(f) + 1 for f in self.fields]).tolist()
+        self._hits = {}
+
+    def lookup(self, token: str) -> np.ndarray:
+        """אינדקסי התחומים (ממוינים) שמכילים את token."""
+        hits = self._hits.get(token)
+        if hits is not None:
+            return hits
+        if not token or self.SEP in token:
+            found = [k for k, f in enumerate(self.fields) if token in f]
+        else:
+            found = []
+            pos = self._text.find(token)
+            while pos != -1:
+                k = bisect_right(self._starts, pos) - 1
+                found.append(k)
+                # מספיק מופע אחד בכל תחום – ממשיכים מתחילת התחום הבא
+                pos = self._text.find(token, self._starts[k + 1])
+        hits = self._hits[token] = np.array(found, dtype=np.int64)
+        return hits
+
+    def matching(self, tokens) -> np.ndarray:
+        """התחומים שמכילים לפחות אחת מהמילים."""
+        hits = [self.lookup(tok) for tok in tokens]
+        if len(hits) == 1:
+            return hits[0]
+        return np.unique(np.concatenate(hits)) if hits else np.zeros(0, dtype=np.int64)
+
+@lru_cache(maxsize=8)
+def field_index(fields: tuple) -> FieldIndex:
+    """אינדקס אחד לכל קובץ אתרים (לפי רשימת התחומים), משותף לכל ריצות הניקוד עליו."""
+    return FieldIndex(fields)
+
+class ScoreMatrix:
+    """
+    ניקוד כל הזוגות סטודנט×אתר בבת אחת.
+    field / city / special הם מטריצות uint8 בגודל (סטודנטים, אתרים) עם ערכי הרכיב (0–100),
+    ו-score הוא הציון הסופי לפי Weights – זהה ל-compute_score_with_explain.
+    """
+
+    def __init__(self, students_df: pd.DataFrame, sites_df: pd.DataFrame, W: Weights):
+        self.W = W
+        stu_city_codes, stu_cities = _lower_codes(students_df, "stu_city")
+        site_city_codes, site_cities = _lower_codes(sites_df, "site_city")
+        pref_codes, pref_uniques = _lower_codes(students_df, "stu_pref")
+        field_codes, field_uniques = _lower_codes(sites_df, "site_field")
+        req_codes, req_uniques = _lower_codes(students_df, "stu_req")
+
+        # 1) תחום – כל העדפה מפוצלת פעם אחת לקודי מילים. האינדקס ההפוך נותן לכל מילה את התחומים
+        #    שמכילים אותה; כל השאר נשארים בדלי ה-0 שמאותחל בבת אחת
+        self.pref_tokens, self.token_uniques = self._split_tokens(pref_uniques)
+        index = field_index(tuple(field_uniques))
+        by_pref = np.zeros((len(pref_uniques), len(field_uniques)), dtype=np.uint8)
+        for k, tokens in enumerate(self.pref_tokens):
+            if len(tokens):
+                by_pref[k, index.matching(self.token_uniques[tokens])] = 100
+            else:
+                by_pref[k] = 70
+        self.field = by_pref[np.ix_(pref_codes, field_codes)]
+
+        # 2) עיר – רצועת מרחק לכל צירוף ייחודי של ערים (זיהוי השם במאגר פעם אחת לכל איות),
+        #    ואז פריסה לכל הזוגות
+        city_codes, _ = pd.factorize(np.concatenate([stu_cities, site_cities]))
+        stu_code = city_codes[:len(stu_cities)][stu_city_codes]
+        self.city = city_points_table(stu_cities, site_cities)[np.ix_(stu_city_codes, site_city_codes)]
+
+        # 3) בקשות מיוחדות – קטגוריה אחת לכל סטודנט/ית
+        kind_of_req = np.array(
+            [SPECIAL_NEAR if "קרוב" in r else SPECIAL_NORTH if "צפון" in r else SPECIAL_NONE
+             for r in req_uniques],
+            dtype=np.int8,
+        )
+        self.special_kind = kind_of_req[req_codes]
+        self.site_north = REGION_NORTH[gazetteer.ids(site_cities)][site_city_codes]
+        special = np.full(self.city.shape, 50, dtype=np.uint8)
+        near = self.special_kind == SPECIAL_NEAR
+        north = self.special_kind == SPECIAL_NORTH
+        special[near] = self.city[near]
+        special[north] = np.where(self.site_north, 75, 50)
+        self.special = special
+
+        # פרופיל = צירוף (העדפה, עיר, סוג בקשה); לסטודנטים באותו פרופיל שורות ניקוד זהות
+        profile_key = (pref_codes.astype(np.int64) * (city_codes.max(initial=0) + 2)
+                       + stu_code) * 3 + self.special_kind
+        self.profile, _ = pd.factorize(profile_key)
+
+        self.score = self.scores_for(W)
+
+    @staticmethod
+    def _split_tokens(pref_uniques: np.ndarray):
+        """לכל העדפה ייחודית – מערך קודי המילים שלה; ומערך המילים עצמן."""
+        vocab = {}
+        token_codes = [np.array([vocab.setdefault(tok, len(vocab)) for tok in split_pref_tokens(pref)],
+                                dtype=np.int64)
+                       for pref in pref_uniques]
+        return token_codes, np.array(list(vocab), dtype=object)
+
+    @property
+    def shape(self):
+        return self.field.shape
+
+    def scores_for(self, W: Weights) -> np.ndarray:
+        # מצטברים במערך int16 אחד שמוקצה מראש – לכל היותר עוד מטריצת int16 זמנית אחת בכל שלב
+        total = _points_lut(W.w_field)[self.field]
+        np.add(total, _points_lut(W.w_city)[self.city], out=total, dtype=np.int16)
+        np.add(total, _points_lut(W.w_special)[self.special], out=total, dtype=np.int16)
+        return np.clip(total, 0, 100, out=total)
+
+    def with_weights(self, W: Weights) -> "ScoreMatrix":
+        """אותם רכיבים, משקלים אחרים – בלי לחשב מחדש את ההתאמות."""
+        clone = copy.copy(self)
+        clone.W = W
+        clone.score = self.scores_for(W)
+        return clone
+
+    def take(self, rows: np.ndarray) -> "ScoreMatrix":
+        """אותם אתרים, רק השורות של הסטודנטים ב-rows (למשל מי שלא שובץ/ה כזוג)."""
+        clone = copy.copy(self)
+        for name in ("field", "city", "special", "score", "special_kind"):
+            setattr(clone, name, getattr(self, name)[rows])
+        clone.profile, _ = pd.factorize(self.profile[rows])  # קודים רציפים, כמו ב-__init__
+        return clone
+
+    def explain(self, i: int, j: int, W: Optional[Weights] = None) -> dict:
+        W = W or self.W
+        return {
+            "התאמת תחום": round(W.w_field * int(self.field[i, j])),
+            "מרחק/גיאוגרפיה": round(W.w_city * int(self.city[i, j])),
+            "בקשות מיוחדות": round(W.w_special * int(self.special[i, j])),
+            "עדיפויות הסטודנט/ית": 0
+        }
+
+def _unassigned_row(stu_id, first, last) -> dict:
+    return {
+        "ת\"ז הסטודנט": stu_id,
+        "שם פרטי": first,
+        "שם משפחה": last,
+        "שם מקום ההתמחות": "לא שובץ",
+        "עיר המוסד": "",
+        "תחום ההתמחות במוסד": "",
+        "שם המדריך": "",
+        "אחוז התאמה": 0,
+        "_expl": {
+            "התאמת תחום": 0,
+            "מרחק/גיאוגרפיה": 0,
+            "בקשות מיוחדות": 0,
+            "עדיפויות הסטודנט/ית": 0
+        }
+    }
+
+def _assigned_row(stu_id, first, last, site_name, site_city, site_field, supervisor,
+                  score: int, expl: dict) -> dict:
+    return {
+        "ת\"ז הסטודנט": stu_id,
+        "שם פרטי": first,
+        "שם משפחה": last,
+        "שם מקום ההתמחות": site_name,
+        "עיר המוסד": site_city,
+        "תחום ההתמחות במוסד": site_field,
+        "שם המדריך": supervisor,
+        "אחוז התאמה": score,
+        "_expl": expl
+    }
+
+def _column_values(df: pd.DataFrame, col: str, default: Any = "") -> list:
+    return df[col].tolist() if col in df.columns else [default] * len(df)
+
+def supervisor_codes(sites_df: pd.DataFrame) -> np.ndarray:
+    codes, _ = pd.factorize(pd.Series(_column_values(sites_df, "שם המדריך"), dtype=object))
+    return codes
+
+def greedy_assign(score: np.ndarray, profile: np.ndarray, capacity: np.ndarray,
+                  sup_codes: np.ndarray, max_per_supervisor: int = MAX_STUDENTS_PER_SUPERVISOR,
+                  progress: Optional[Callable[[int, int], None]] = None,
+                  supervisor_count: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    ליבת השיבוץ החמדני. מחזירה לכל סטודנט/ית את אינדקס האתר (או -1 אם לא שובץ/ה).
+    progress(done, total), אם הועבר, נקרא מדי פעם במהלך הלולאה.
+    supervisor_count, אם הועבר, הוא מספר הסטודנטים שכבר משובצים אצל כל מדריך (לשיבוץ חלקי).
+    לכל פרופיל ניקוד (שורות זהות במטריצה) נשמרת רשימת אתרים ממוינת פעם אחת, ושני מצביעים
+    מדלגים על אתרים שנסגרו: אחד לאתרים שעוברים את מגבלת המדריך ואחד לכל האתרים הפנויים.
+    אתרים רק נסגרים ולא נפתחים מחדש, ולכן כל מצביע מתקדם לכל היותר פעם אחת על כל אתר.
+    """
+    n_students, n_sites = score.shape
+    cap_left = np.asarray(capacity, dtype=np.int64).copy()
+    is_open = cap_left > 0
+    allowed = is_open.copy()
+
+    sup_codes = np.asarray(sup_codes)
+    n_sup = int(sup_codes.max()) + 1 if n_sites else 0
+    if supervisor_count is None:
+        supervisor_count = np.zeros(n_sup, dtype=np.int64)
+    else:
+        supervisor_count = np.asarray(supervisor_count, dtype=np.int64).copy()
+    sites_of_sup = [[] for _ in range(n_sup)]
+    for j, s in enumerate(sup_codes):
+        sites_of_sup[s].append(j)
+    for s in np.nonzero(supervisor_count >= max_per_supervisor)[0]:
+        allowed[sites_of_sup[s]] = False
+
+    ranked = {}  # פרופיל -> [סדר אתרים, מצביע מותרים, מצביע פנויים]
+    assign = np.full(n_students, -1, dtype=np.int64)
+    report_every = max(1, n_students // 100)
+
+    for i in range(n_students):
+        if progress is not None and i % report_every == 0:
+            progress(i, n_students)
+
+        entry = ranked.get(profile[i])
+        if entry is None:
+            order = np.argsort(-score[i].astype(np.int64), kind="stable").tolist()
+            entry = ranked[profile[i]] = [order, 0, 0]
+        order = entry[0]
+
+        k = entry[1]
+        while k < n_sites and not allowed[order[k]]:
+            k += 1
+        entry[1] = k
+        if k < n_sites:
+            j = order[k]
+        else:
+            # אין אתר שעובר את סינון המדריכים – בוחרים את הטוב מכל הפנויים
+            k = entry[2]
+            while k < n_sites and not is_open[order[k]]:
+                k += 1
+            entry[2] = k
+            if k == n_sites:
+                continue
+            j = order[k]
+
+        assign[i] = j
+        cap_left[j] -= 1
+        if cap_left[j] == 0:
+            is_open[j] = False
+            allowed[j] = False
+
+        sup = sup_codes[j]
+        supervisor_count[sup] += 1
+        if supervisor_count[sup] == max_per_supervisor:
+            allowed[sites_of_sup[sup]] = False
+
+    if progress is not None:
+        progress(n_students, n_students)
+    return assign
+
+def assignment_to_results(students_df: pd.DataFrame, sites_df: pd.DataFrame,
+                          scores: ScoreMatrix, assign: np.ndarray) -> pd.DataFrame:
+    """ממיר וקטור שיבוץ (אינדקס אתר לכל סטודנט/ית, -1 = לא שובץ) לטבלת התוצאות המלאה."""
+    sup_names = _column_values(sites_df, "שם המדריך")
+    site_name = _column_values(sites_df, "site_name")
+    site_city = _column_values(sites_df, "site_city")
+    site_field = _column_values(sites_df, "site_field")
+
+    results = []
+    for i, (stu_id, first, last) in enumerate(zip(students_df["stu_id"],
+                                                   students_df["stu_first"],
+                                                   students_df["stu_last"])):
+        j = int(assign[i])
+        if j < 0:
+            results.append(_unassigned_row(stu_id, first, last))
+            continue
+        results.append(_assigned_row(stu_id, first, last, site_name[j], site_city[j], site_field[j],
+                                     sup_names[j], int(scores.score[i, j]), scores.explain(i, j)))
+    return pd.DataFrame(results)
+
+def greedy_match(students_df: pd.DataFrame, sites_df: pd.DataFrame, W: Weights,
+                 scores: Optional[ScoreMatrix] = None) -> pd.DataFrame:
+    """
+    שיבוץ חמדני לפי סדר הסטודנטים בקובץ: כל סטודנט/ית מקבל/ת את האתר הפנוי עם הציון הגבוה ביותר,
+    בכפוף למגבלת מדריך (MAX_STUDENTS_PER_SUPERVISOR). אם אין אתר שעובר את סינון המדריכים –
+    בוחרים את הטוב מכל הפנויים. בשוויון ציונים נבחר האתר הראשון בקובץ.
+    """
+    scores = scores if scores is not None else ScoreMatrix(students_df, sites_df, W)
+    capacity = sites_df["capacity_left"].to_numpy(dtype=np.int64)
+    assign = greedy_assign(scores.score, scores.profile, capacity, supervisor_codes(sites_df))
+
+    used = np.bincount(assign[assign >= 0], minlength=len(sites_df))
+    sites_df["capacity_left"] = capacity - used
+    return assignment_to_results(students_df, sites_df, scores, assign)
+
+# ========= שיבוץ אופטימלי (זרימה בעלות מינימלית) =========
+MATCH_MODES = ("greedy", "optimal")
+# כמה קשתות (מחלקות אתרים) לכל מחלקת סטודנטים בפתרון הראשון, ולכל היותר בכל סבב הוספה
+OPTIMAL_INITIAL_ARCS = 8
+
+def supervisor_overflow(assign: np.ndarray, sup_codes: np.ndarray,
+                        max_per_supervisor: int = MAX_STUDENTS_PER_SUPERVISOR) -> int:
+    """כמה שיבוצים חורגים ממגבלת המדריך (סכום החריגות על פני כל המדריכים)."""
+    placed = assign[assign >= 0]
+    if placed.size == 0:
+        return 0
+    per_sup = np.bincount(np.asarray(sup_codes)[placed])
+    return int(np.clip(per_sup - max_per_supervisor, 0, None).sum())
+
+def _solve_class_flow(arc_cost: np.ndarray, active: np.ndarray, demand: np.ndarray, col_class: np.ndarray,
+                      cap: np.ndarray, sup_codes: np.ndarray, sup_room: np.ndarray, overflow_penalty: int):
+    """
+    בעיית הזרימה על הקשתות הפעילות בלבד. משתנים: x לכל קשת פעילה (מחלקה -> מחלקה),
+    y[j] (זרימה דרך אתר), o[s] (חריגה של מדריך). מחזיר את תוצאת linprog ואת הקשתות.
+    """
+    from scipy import sparse
+    from scipy.optimize import linprog
+
+    n_rows, n_cols = active.shape
+    n_sites, n_sup = len(col_class), len(sup_room)
+    arc_r, arc_k = np.nonzero(active)
+    n_x = len(arc_r)
+    ix = np.arange(n_x)
+    iy = n_x + np.arange(n_sites)
+    io = n_x + n_sites + np.arange(n_sup)
+    cost = np.concatenate([arc_cost[arc_r, arc_k], np.zeros(n_sites), np.full(n_sup, float(overflow_penalty))])
+
+    # אילוצי אי-שוויון: ביקוש של כל מחלקת סטודנטים, ומגבלת מדריך
+    a_ub = sparse.csr_matrix(
+        (np.concatenate([np.ones(n_x), np.ones(n_sites), -np.ones(n_sup)]),
+         (np.concatenate([arc_r, n_rows + sup_codes, n_rows + np.arange(n_sup)]),
+          np.concatenate([ix, iy, io]))),
+        shape=(n_rows + n_sup, len(cost)),
+    )
+    b_ub = np.concatenate([demand, sup_room]).astype(np.float64)
+
+    # שימור זרימה: מה שנכנס למחלקת אתרים יוצא דרך האתרים שלה
+    a_eq = sparse.csr_matrix(
+        (np.concatenate([np.ones(n_x), -np.ones(n_sites)]),
+         (np.concatenate([arc_k, col_class]), np.concatenate([ix, iy]))),
+        shape=(n_cols, len(cost)),
+    )
+    b_eq = np.zeros(n_cols)
+
+    upper = np.concatenate([np.full(n_x, np.inf), cap.astype(np.float64), np.full(n_sup, np.inf)])
+    res = linprog(cost, A_ub=a_ub, b_ub=b_ub, A_eq=a_eq, b_eq=b_eq,
+                  bounds=np.column_stack([np.zeros(len(cost)), upper]), method="highs-ds")
+    if res.status != 0:
+        raise RuntimeError(f"השיבוץ האופטימלי נכשל: {res.message}")
+    return res, arc_r, arc_k
+
+def optimal_assign(scores: ScoreMatrix, capacity: np.ndarray, sup_codes: np.ndarray,
+                   max_per_supervisor: int = MAX_STUDENTS_PER_SUPERVISOR,
+                   supervisor_count: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    שיבוץ שממקסם את סכום הציונים, כבעיית זרימה בעלות מינימלית:
+    מחלקת סטודנטים -> מחלקת אתרים -> אתר (קיבולת) -> מדריך (עד max_per_supervisor).
+    סטודנטים עם שורת ציונים זהה ואתרים עם עמודת ציונים זהה מאוחדים למחלקות,
+    כך שגודל הבעיה תלוי במספר הפרופילים השונים ולא בגודל המחזור.
+
+    סדר העדיפויות (כמו בחמדני): קודם לשבץ כמה שיותר סטודנטים, אחר כך לא לחרוג ממגבלת
+    המדריך (החריגה מותרת רק כשאין ברירה), ורק אז למקסם את הציון הכולל.
+    מטריצת האילוצים היא מטריצת רשת, ולכן פתרון הסימפלקס שלם.
+    supervisor_count, אם הועבר, הוא מספר הסטודנטים שכבר משובצים אצל כל מדריך (למשל זוגות).
+
+    לא בונים את כל הקשתות מחלקה × מחלקה (אלפי פרופילים × אלפי אתרים): פותרים על קבוצה קטנה
+    ומוסיפים קשתות לפי העלות המופחתת (ראו _solve_class_flow), עד שאין קשת משפרת.
+    """
+    score = scores.score
+    n_students, n_sites = score.shape
+    assign = np.full(n_students, -1, dtype=np.int64)
+    capacity = np.asarray(capacity, dtype=np.int64)
+    if n_students == 0 or n_sites == 0 or capacity.clip(min=0).sum() == 0:
+        return assign
+
+    # מחלקות סטודנטים (שורות זהות) ומחלקות אתרים (עמודות זהות)
+    _, first_of_profile = np.unique(scores.profile, return_index=True)
+    rows, row_of_profile = np.unique(score[first_of_profile], axis=0, return_inverse=True)
+    row_class = row_of_profile.ravel()[scores.profile]
+    class_score, col_class = np.unique(rows, axis=1, return_inverse=True)
+    col_class = col_class.ravel()
+    n_rows, n_cols = class_score.shape
+    demand = np.bincount(row_class, minlength=n_rows)
+
+    sup_codes = np.asarray(sup_codes)
+    n_sup = int(sup_codes.max()) + 1
+    cap = capacity.clip(min=0)
+
+    # עלויות: בונוס שיבוץ > קנס חריגה > כל הפרש אפשרי בציון הכולל
+    overflow_penalty = 100 * n_students + 1
+    assign_bonus = overflow_penalty + 100 * n_students + 1
+    arc_cost = -(class_score.astype(np.float64) + assign_bonus)
+
+    sup_room = np.full(n_sup, max_per_supervisor, dtype=np.int64)
+    if supervisor_count is not None:
+        sup_room = np.clip(sup_room - np.asarray(supervisor_count, dtype=np.int64)[:n_sup], 0, None)
+
+    # קשתות מחלקה -> מחלקה: מתחילים מהמחלקות הטובות של כל מחלקת סטודנטים (עד שהקיבולת מכסה
+    # את הביקוש, ולפחות OPTIMAL_INITIAL_ARCS), ומוסיפים קשתות רק כשהמחירים הדואליים מראים
+    # שהן משפרות. בסוף אין קשת עם עלות מופחתת שלילית, ולכן הפתרון אופטימלי גם לבעיה המלאה.
+    col_cap = np.bincount(col_class, weights=cap, minlength=n_cols)
+    order = np.argsort(-class_score, axis=1, kind="stable")
+    cap_before = np.cumsum(col_cap[order], axis=1) - col_cap[order]
+    ranked_in = (cap_before < demand[:, None]) | (np.arange(n_cols) < OPTIMAL_INITIAL_ARCS)
+    active = np.zeros((n_rows, n_cols), dtype=bool)
+    np.put_along_axis(active, order, ranked_in, axis=1)
+    # ובכיוון השני: לכל מחלקת אתרים – מחלקות הסטודנטים הטובות עד שהביקוש מכסה את הקיבולת
+    order_t = np.argsort(-class_score.T, axis=1, kind="stable")
+    demand_before = np.cumsum(demand[order_t], axis=1) - demand[order_t]
+    ranked_in_t = (demand_before < col_cap[:, None]) | (np.arange(n_rows) < OPTIMAL_INITIAL_ARCS)
+    active_t = np.zeros((n_cols, n_rows), dtype=bool)
+    np.put_along_axis(active_t, order_t, ranked_in_t, axis=1)
+    active |= active_t.T
+
+    while True:
+        res, arc_r, arc_k = _solve_class_flow(arc_cost, active, demand, col_class, cap,
+                                              sup_codes, sup_room, overflow_penalty)
+        # עלות מופחתת לכל קשת: c - u[r] - v[k]; שלילית = קשת שהייתה משפרת את הפתרון
+        reduced = arc_cost - res.ineqlin.marginals[:n_rows, None] - res.eqlin.marginals[None, :]
+        improving = (reduced < -0.5) & ~active
+        if not improving.any():
+            break
+        # לכל מחלקת סטודנטים – עד OPTIMAL_INITIAL_ARCS הקשתות המשפרות ביותר
+        worst = np.argsort(np.where(improving, reduced, 0.0), axis=1, kind="stable")[:, :OPTIMAL_INITIAL_ARCS]
+        add = np.zeros_like(active)
+        np.put_along_axis(add, worst, True, axis=1)
+        active |= add & improving
+
+    n_x = len(arc_r)
+    flow = np.zeros((n_rows, n_cols), dtype=np.int64)
+    flow[arc_r, arc_k] = np.rint(res.x[:n_x]).astype(np.int64)
+    site_flow = np.rint(res.x[n_x:n_x + n_sites]).astype(np.int64)
+
+    # פירוק הזרימה חזרה לסטודנטים: בתוך מחלקה כל הסטודנטים והאתרים שקולים בציון
+    slots = [[] for _ in range(n_cols)]
+    for j in range(n_sites):
+        slots[col_class[j]].extend([j] * int(site_flow[j]))
+    students_of = [[] for _ in range(n_rows)]
+    for i, r in enumerate(row_class):
+        students_of[r].append(i)
+    taken = [0] * n_cols
+    for r in range(n_rows):
+        queue = students_of[r]
+        pos = 0
+        for k in np.argsort(-class_score[r], kind="stable"):
+            units = int(flow[r, k])
+            if units:
+                chosen = slots[k][taken[k]:taken[k] + units]
+                assign[queue[pos:pos + units]] = chosen
+                taken[k] += units
+                pos += units
+    return assign
+
+# ========= בני/בנות זוג להכשרה =========
+# זוג מוצהר משובץ כיחידה אחת, לפני כל השאר: לאותו אתר (שני מקומות פנויים), ואם אין –
+# לשני אתרים של אותו מדריך/ה. ציון הזוג באתר הוא סכום שתי השורות, כך שלא עוברים על
+# צירופי זוג×זוג – כל זוג עולה מעבר אחד על האתרים, כמו סטודנט/ית בודד/ה.
+def _person_key(value: str) -> str:
+    value = " ".join(value.split())
+    return value.lstrip("0") if value.isdigit() else value
+
+def partner_pairs(students_df: pd.DataFrame):
+    """
+    זוגות (i, j) לפי עמודת stu_partner – ת"ז או שם מלא של בן/בת הזוג. הצהרה חד-צדדית מספיקה
+    כל עוד הצד השני לא הצהיר על מישהו/י אחר/ת. מחזיר (מערך זוגות בגודל k×2 לפי סדר הקובץ,
+    רשימת הצהרות שלא הובילו לזוג עם הסיבה).
+    """
+    if "stu_partner" not in students_df.columns:
+        return np.empty((0, 2), dtype=np.int64), []
+    ids = students_df["stu_id"].tolist()
+    declared = [normalize_text(v) for v in students_df["stu_partner"].tolist()]
+    names = [f"{normalize_text(f)} {normalize_text(l)}"
+             for f, l in zip(students_df["stu_first"].tolist(), students_df["stu_last"].tolist())]
+
+    by_key = {}
+    for i, key in enumerate(map(_person_key, ids)):
+        by_key.setdefault(key, []).append(i)
+    by_name = {}
+    for i, name in enumerate(names):
+        by_name.setdefault(_person_key(name), []).append(i)
+        first, _, last = name.partition(" ")
+        by_name.setdefault(_person_key(f"{last} {first}"), []).append(i)
+
+    ref = np.full(len(ids), -1, dtype=np.int64)
+    issues = []
+    for i, value in enumerate(declared):
+        if not value:
+            continue
+        key = _person_key(value)
+        found = by_key.get(key) or by_name.get(key) or []
+        found = sorted(set(found) - {i})
+        if len(found) == 1:
+            ref[i] = found[0]
+        else:
+            issues.append({"stu_id": ids[i], "partner": value,
+                           "reason": "בן/בת הזוג לא נמצא/ה בקובץ" if not found else "השם מתאים לכמה סטודנטים"})
+
+    pairs, paired = [], np.zeros(len(ids), dtype=bool)
+    for i in np.nonzero(ref >= 0)[0]:
+        j = ref[i]
+        if paired[i] and ref[j] == i:
+            continue  # הזוג כבר נרשם מהצד השני
+        if ref[j] not in (-1, i):
+            issues.append({"stu_id": ids[i], "partner": declared[i], "reason": "בן/בת הזוג הצהיר/ה על מישהו/י אחר/ת"})
+        elif paired[i] or paired[j]:
+            issues.append({"stu_id": ids[i], "partner": declared[i], "reason": "כבר משויך/ת לזוג אחר"})
+        else:
+            pairs.append((min(i, j), max(i, j)))
+            paired[i] = paired[j] = True
+    pairs = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+    return pairs, issues
+
+def assign_pairs(score: np.ndarray, pairs: np.ndarray, capacity: np.ndarray, sup_codes: np.ndarray,
+                 sup_named: np.ndarray, max_per_supervisor: int = MAX_STUDENTS_PER_SUPERVISOR,
+                 supervisor_count: Optional[np.ndarray] = None):
+    """
+    שיבוץ חמדני של הזוגות לפי סדר הקובץ. לכל זוג, לפי סדר עדיפות:
+    1) אתר עם 2 מקומות פנויים שהמדריך/ה שלו יכול/ה לקבל עוד שניים – הטוב ביותר בסכום הציונים;
+    2) שני אתרים שונים של אותו מדריך/ה (עם שם) שיכול/ה לקבל עוד שניים;
+    3) אתר עם 2 מקומות פנויים גם בחריגה ממגבלת המדריך (כמו החמדני כשאין ברירה).
+    זוג שלא נמצא לו אף אחד מאלה נשאר לא משובץ כאן וממשיך לשיבוץ הרגיל כשני בודדים.
+    supervisor_count, אם הועבר, הוא מספר הסטודנטים שכבר משובצים אצל כל מדריך (לשיבוץ חלקי).
+    מחזיר (מערך אתרים k×2, -1 = לא שובצו יחד; יתרת קיבולת; מספר משובצים לכל מדריך).
+    """
+    cap_left = np.asarray(capacity, dtype=np.int64).copy()
+    sup_codes = np.asarray(sup_codes)
+    n_sup = int(sup_codes.max()) + 1 if len(sup_codes) else 0
+    if supervisor_count is None:
+        supervisor_count = np.zeros(n_sup, dtype=np.int64)
+    else:
+        supervisor_count = np.asarray(supervisor_count, dtype=np.int64).copy()
+    sup_named = np.asarray(sup_named, dtype=bool)
+    sites_of_sup = [[] for _ in range(n_sup)]
+    for j, sup in enumerate(sup_codes):
+        sites_of_sup[sup].append(j)
+
+    placed = np.full(pairs.shape, -1, dtype=np.int64)
+    for p, (a, b) in enumerate(pairs):
+        joint = score[a].astype(np.int32) + score[b]
+        room2 = (max_per_supervisor - supervisor_count)[sup_codes] >= 2
+        two_free = cap_left >= 2
+
+        ok = two_free & room2
+        if ok.any():
+            j = int(np.argmax(np.where(ok, joint, -1)))
+            placed[p] = (j, j)
+        else:
+            ok = (cap_left >= 1) & room2 & sup_named
+            ja = jb = -1
+            if ok.any():
+                # חסם עליון לכל מדריך/ה: הטוב ביותר לכל אחד/ת בנפרד (אולי באותו אתר). בדיקה מדויקת
+                # (שני אתרים שונים) לפי סדר החסם, עד שהחסם הבא כבר נמוך מהזוג הטוב שנמצא
+                best_a = np.full(n_sup, -1, dtype=np.int64)
+                best_b = np.full(n_sup, -1, dtype=np.int64)
+                np.maximum.at(best_a, sup_codes[ok], score[a][ok])
+                np.maximum.at(best_b, sup_codes[ok], score[b][ok])
+                enough = np.bincount(sup_codes[ok], minlength=n_sup) >= 2
+                bound = np.where(enough, best_a + best_b, -1)
+                best = None
+                for sup in np.argsort(-bound, kind="stable"):
+                    if bound[sup] < 0 or (best is not None and bound[sup] < best[0]):
+                        break
+                    candidates = [j for j in sites_of_sup[sup] if ok[j]]
+                    found = max((int(score[a][x]) + int(score[b][y]), -x, -y)
+                                for x in candidates for y in candidates if x != y)
+                    best = found if best is None else max(best, found)
+                if best is not None:
+                    ja, jb = -best[1], -best[2]
+            if ja >= 0:
+                placed[p] = (ja, jb)
+            elif two_free.any():
+                j = int(np.argmax(np.where(two_free, joint, -1)))
+                placed[p] = (j, j)
+            else:
+                continue
+        for j in placed[p]:
+            cap_left[j] -= 1
+            supervisor_count[sup_codes[j]] += 1
+    return placed, cap_left, supervisor_count
+
+def joint_assign(scores: ScoreMatrix, capacity: np.ndarray, sup_codes: np.ndarray, sup_named: np.ndarray,
+                 pairs: np.ndarray, mode: str = "greedy", max_per_supervisor: int = MAX_STUDENTS_PER_SUPERVISOR,
+                 progress: Optional[Callable[[int, int], None]] = None):
+    """
+    קודם הזוגות (assign_pairs), ואחר כך כל השאר – בחמדני או באופטימלי – מול הקיבולת והמדריכים
+    שנשארו. מחזיר (שיבוץ לכל סטודנט/ית, מערך האתרים של כל זוג).
+    """
+    placed, cap_left, supervisor_count = assign_pairs(scores.score, pairs, capacity, sup_codes, sup_named,
+                                                      max_per_supervisor)
+    n_students = scores.shape[0]
+    assign = np.full(n_students, -1, dtype=np.int64)
+    together = placed[:, 0] >= 0
+    assign[pairs[together].ravel()] = placed[together].ravel()
+
+    rest = np.nonzero(assign < 0)[0]
+    sub = scores.take(rest)
+    rest_progress = None
+    if progress is not None:
+        # ההתקדמות נספרת בסטודנטים מתוך כל המחזור: מי ששובצו כזוג כבר טופלו
+        offset = n_students - len(rest)
+        progress(offset, n_students)
+
+        def rest_progress(done: int, _total: int) -> None:
+            progress(offset + done, n_students)
+    if mode == "greedy":
+        assign[rest] = greedy_assign(sub.score, sub.profile, cap_left, sup_codes, max_per_supervisor,
+                                     progress=rest_progress, supervisor_count=supervisor_count)
+    else:
+        assign[rest] = optimal_assign(sub, cap_left, sup_codes, max_per_supervisor,
+                                      supervisor_count=supervisor_count)
+    return assign, placed
+
+def supervisor_named(sites_df: pd.DataFrame) -> np.ndarray:
+    """לכל אתר: האם יש לו מדריך/ה עם שם (רק אז שני אתרים שלו/ה נחשבים "יחד" לזוג)."""
+    return np.array([bool(name) for name in _column_values(sites_df, "שם המדריך")], dtype=bool)
+
+def pairs_together(pairs: np.ndarray, assign: np.ndarray, sup_codes: np.ndarray,
+                   sup_named: np.ndarray) -> np.ndarray:
+    """לכל זוג: האם שני בני הזוג משובצים יחד – באותו אתר, או אצל אותו/ה מדריך/ה עם שם."""
+    if not len(pairs) or not len(sup_codes):
+        return np.zeros(len(pairs), dtype=bool)
+    a, b = assign[pairs[:, 0]], assign[pairs[:, 1]]
+    both = (a >= 0) & (b >= 0)
+    a, b = np.maximum(a, 0), np.maximum(b, 0)
+    return both & ((a == b) | ((sup_codes[a] == sup_codes[b]) & sup_named[a]))
+
+def partner_report(students_df: pd.DataFrame, sites_df: pd.DataFrame, pairs: np.ndarray,
+                   placed: np.ndarray, assign: np.ndarray, issues: list) -> dict:
+    """סיכום הזוגות לדוח: כמה שובצו יחד (באתר / אצל מדריך/ה), ומי לא – והיכן כל אחד/ת שובץ/ה בסוף."""
+    ids = students_df["stu_id"].tolist()
+    site_names = _column_values(sites_df, "site_name")
+    together = placed[:, 0] >= 0
+    apart = [{"students": [ids[a], ids[b]],
+              "sites": [site_names[assign[a]] if assign[a] >= 0 else "לא שובץ",
+                        site_names[assign[b]] if assign[b] >= 0 else "לא שובץ"]}
+             for (a, b) in pairs[~together]]
+    return {
+        "pairs": int(len(pairs)),
+        "same_site": int((together & (placed[:, 0] == placed[:, 1])).sum()),
+        "same_supervisor": int((together & (placed[:, 0] != placed[:, 1])).sum()),
+        "not_together": apart,
+        "unresolved": issues,
+    }
+
+def match_report(scores: ScoreMatrix, assign: np.ndarray, greedy: np.ndarray,
+                 sup_codes: np.ndarray, mode: str) -> dict:
+    """סיכום השיבוץ מול השיבוץ החמדני: ציון כולל, מספר משובצים, חריגות מדריך והפער."""
+    def total(a):
+        placed = a >= 0
+        return int(scores.score[np.nonzero(placed)[0], a[placed]].astype(np.int64).sum())
+
+    total_score, greedy_total = total(assign), total(greedy)
+    return {
+        "mode": mode,
+        "total_score": total_score,
+        "assigned": int((assign >= 0).sum()),
+        "supervisor_overflow": supervisor_overflow(assign, sup_codes),
+        "greedy_total_score": greedy_total,
+        "greedy_assigned": int((greedy >= 0).sum()),
+        "greedy_supervisor_overflow": supervisor_overflow(greedy, sup_codes),
+        "gap": total_score - greedy_total,
+        "gap_pct": round(100.0 * (total_score - greedy_total) / greedy_total, 2) if greedy_total else 0.0,
+    }
+
+def optimal_match(students_df: pd.DataFrame, sites_df: pd.DataFrame, W: Weights,
+                  scores: Optional[ScoreMatrix] = None) -> pd.DataFrame:
+    """שיבוץ אופטימלי גלובלי (לא תלוי בסדר השורות בקובץ). ראו optimal_assign."""
+    scores = scores if scores is not None else ScoreMatrix(students_df, sites_df, W)
+    capacity = sites_df["capacity_left"].to_numpy(dtype=np.int64)
+    assign = optimal_assign(scores, capacity, supervisor_codes(sites_df))
+
+    used = np.bincount(assign[assign >= 0], minlength=len(sites_df))
+    sites_df["capacity_left"] = capacity - used
+    return assignment_to_results(students_df, sites_df, scores, assign)
+
+def run_matching(students_df: pd.DataFrame, sites_df: pd.DataFrame, W: Weights,
+                 mode: str = "greedy", progress: Optional[Callable[[int, int], None]] = None,
+                 return_assignment: bool = False):
+    """
+    מריץ שיבוץ בשיטה שנבחרה ("greedy" / "optimal") ומחזיר (טבלת תוצאות, דוח).
+    בכל מקרה מחושב גם השיבוץ החמדני, כדי לדווח על הפער ביניהם.
+    progress(done, total) מדווח כמה סטודנטים כבר טופלו.
+    זוגות מוצהרים (stu_partner) משובצים קודם יחד (joint_assign), והדוח מפרט את מי שלא.
+    עם return_assignment=True מוחזר גם וקטור השיבוץ (אינדקס אתר לכל סטודנט/ית, -1 = לא שובץ).
+    """
+    if mode not in MATCH_MODES:
+        raise ValueError(f"שיטת שיבוץ לא מוכרת: {mode}")
+
+    scores = ScoreMatrix(students_df, sites_df, W)
+    capacity = sites_df["capacity_left"].to_numpy(dtype=np.int64)
+    sup_codes = supervisor_codes(sites_df)
+
+    pairs, issues = partner_pairs(students_df)
+    if len(pairs):
+        sup_named = supervisor_named(sites_df)
+        greedy, placed = joint_assign(scores, capacity, sup_codes, sup_named, pairs, "greedy",
+                                      progress=progress if mode == "greedy" else None)
+        assign = greedy
+        if mode != "greedy":
+            assign, placed = joint_assign(scores, capacity, sup_codes, sup_named, pairs, mode)
+    else:
+        greedy = greedy_assign(scores.score, scores.profile, capacity, sup_codes,
+                               progress=progress if mode == "greedy" else None)
+        assign = greedy if mode == "greedy" else optimal_assign(scores, capacity, sup_codes)
+    if progress is not None and mode != "greedy":
+        progress(len(assign), len(assign))
+
+    used = np.bincount(assign[assign >= 0], minlength=len(sites_df))
+    sites_df["capacity_left"] = capacity - used
+    results = assignment_to_results(students_df, sites_df, scores, assign)
+    report = match_report(scores, assign, greedy, sup_codes, mode)
+    if len(pairs) or issues:
+        report["partners"] = partner_report(students_df, sites_df, pairs,
+                                            placed if len(pairs) else pairs, assign, issues)
+    unresolved = unresolved_cities(students_df, sites_df)
+    if unresolved:
+        report["unresolved_cities"] = unresolved
+    if return_assignment:
+        return results, report, assign
+    return results, report
+
+# ========= השוואת משקלים (sweep) =========
+# הציון ליניארי ברכיבים, ולכן הרכיבים (תחום/עיר/בקשות) מחושבים פעם אחת
+# וכל תצורת משקלים רק מחשבת מחדש את הסכום המשוקלל ומריצה שיבוץ.
+_sweep_state = None
+
+def weight_grid(step: float = 0.05) -> List[Weights]:
+    """כל צירופי המשקלים בקפיצות step שסכומם 1."""
+    n = int(round(1 / step))
+    grid = []
+    for a in range(n + 1):
+        for b in range(n + 1 - a):
+            grid.append(Weights(round(a * step, 6), round(b * step, 6), round((n - a - b) * step, 6)))
+    return grid
+
+def _init_sweep(scores: ScoreMatrix, capacity: np.ndarray, sup_codes: np.ndarray, mode: str,
+                pairs: np.ndarray, sup_named: np.ndarray) -> None:
+    global _sweep_state
+    _sweep_state = (scores, capacity, sup_codes, mode, pairs, sup_named)
+
+def _assign_for_weights(W: Weights):
+    scores, capacity, sup_codes, mode, pairs, sup_named = _sweep_state
+    weighted = scores.with_weights(W)
+    if len(pairs):
+        # כמו run_matching: הזוגות קודם, כך שהשורה של baseline היא השיבוץ שהאתר באמת מפיק
+        assign, _ = joint_assign(weighted, capacity, sup_codes, sup_named, pairs, mode)
+    elif mode == "greedy":
+        assign = greedy_assign(weighted.score, weighted.profile, capacity, sup_codes)
+    else:
+        assign = optimal_assign(weighted, capacity, sup_codes)
+    placed = assign >= 0
+    got = weighted.score[np.nonzero(placed)[0], assign[placed]].astype(np.int64)
+    return assign, got
+
+def weight_sweep(students_df: pd.DataFrame, sites_df: pd.DataFrame, grid: List[Weights],
+                 baseline: Optional[Weights] = None, mode: str = "greedy",
+                 max_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    מריץ שיבוץ לכל תצורת משקלים ב-grid ומחזיר טבלת השוואה: ציון ממוצע (של המשובצים),
+    ציון כולל, כמה לא שובצו, חריגות מדריך, וכמה שיבוצים השתנו לעומת baseline (ברירת מחדל: Weights()).
+    זוגות מוצהרים משובצים יחד בכל תצורה (joint_assign), כמו ב-run_matching.
+    התצורות רצות במקביל בתהליכים נפרדים; max_workers=1 מריץ בתהליך הנוכחי.
+    """
+    if mode not in MATCH_MODES:
+        raise ValueError(f"שיטת שיבוץ לא מוכרת: {mode}")
+    baseline = baseline or Weights()
+    scores = ScoreMatrix(students_df, sites_df, baseline)
+    capacity = sites_df["capacity_left"].to_numpy(dtype=np.int64)
+    sup_codes = supervisor_codes(sites_df)
+    pairs, _ = partner_pairs(students_df)
+    sup_named = supervisor_named(sites_df)
+
+    # לתהליכי העבודה מעבירים רק את הרכיבים – מטריצת הציון מחושבת שם לכל תצורה
+    components = copy.copy(scores)
+    components.score = None
+    configs = [baseline] + list(grid)
+
+    if max_workers == 1 or len(configs) <= 2:
+        _init_sweep(components, capacity, sup_codes, mode, pairs, sup_named)
+        outcomes = [_assign_for_weights(W) for W in configs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_sweep,
+                                 initargs=(components, capacity, sup_codes, mode, pairs, sup_named)) as pool:
+            outcomes = list(pool.map(_assign_for_weights, configs))
+
+    base_assign = outcomes[0][0]
+    rows = []
+    for W, (assign, got) in zip(configs[1:], outcomes[1:]):
+        rows.append({
+            "w_field": W.w_field,
+            "w_city": W.w_city,
+            "w_special": W.w_special,
+            "mean_score": round(float(got.mean()), 2) if got.size else 0.0,
+            "total_score": int(got.sum()),
+            "assigned": int(got.size),
+            "unassigned": int((assign < 0).sum()),
+            "supervisor_overflow": supervisor_overflow(assign, sup_codes),
+            "changed_vs_baseline": int((assign != base_assign).sum()),
+        })
+    return pd.DataFrame(rows)
+
+# ========= שיבוץ מחדש לפי שינויים (delta) =========
+# שינוי קטן (בקשה מיוחדת של סטודנט/ית, קיבולת של אתר, מדריך שעוזב) לא מחייב לחשב את כל המטריצה:
+# משחררים רק את מי שהשיבוץ שלו/ה עלול להשתנות, מחשבים רק את השורות/העמודות שלהם, ומתקנים מקומית.
+# מבנה ה-delta (השדות הם העמודות המזוהות, stu_* / site_*):
+#   {"students": {"add": [{"stu_id": ..., ...}], "remove": ["<ת\"ז>"], "edit": [{"stu_id": ..., "stu_req": ...}]},
+#    "sites":    {"add": [{"site_name": ..., ...}], "remove": ["<שם אתר>"], "edit": [{"site_name": ..., "site_capacity": 3}]}}
+DELTA_STUDENT_COLS = RESOLVED_STUDENT_COLS
+DELTA_SITE_COLS = ["site_name", "site_field", "site_city", "site_capacity", "שם המדריך"]
+# עריכה של אחת מאלה משנה את הציון / את מגבלת המדריך של מי שכבר משובץ/ת באתר
+SITE_MATCH_COLS = {"site_field", "site_city", "שם המדריך"}
+
+DELTA_SECTIONS = {"students": "stu_id", "sites": "site_name"}
+DELTA_ACTIONS = ("add", "edit", "remove")
+
+def _check_delta_section(name: str, section: Any) -> dict:
+    """חלק אחד של ה-delta (students / sites): dict, ו-add / edit של dict-ים, remove של מזהים."""
+    if section is None:
+        return {}
+    if not isinstance(section, dict):
+        raise ValueError(f"delta.{name} חייב להיות אובייקט עם add / edit / remove")
+    unknown = set(section) - set(DELTA_ACTIONS)
+    if unknown:
+        raise ValueError(f"פעולה לא מוכרת ב-delta.{name}: {', '.join(sorted(map(str, unknown)))}")
+    for action, items in section.items():
+        if not isinstance(items, list):
+            raise ValueError(f"delta.{name}.{action} חייב להיות רשימה")
+        for item in items:
+            if action == "remove":
+                ok, expected = isinstance(item, (str, int)) and not isinstance(item, bool), "מזהים"
+            else:
+                ok, expected = isinstance(item, dict), "אובייקטים"
+            if not ok:
+                raise ValueError(f"delta.{name}.{action} חייב להכיל {expected}, התקבל: {item!r}")
+    return section
+
+def check_delta(delta: Any) -> dict:
+    """
+    בדיקת מבנה ה-delta לפני שנוגעים בטבלאות: אובייקט עם students / sites בלבד, וכל חלק תקין
+    (_check_delta_section). כל מבנה אחר -> ValueError, ולא חריגה אחרת באמצע השיבוץ.
+    """
+    if delta is None:
+        return {}
+    if not isinstance(delta, dict):
+        raise ValueError("delta חייב להיות אובייקט JSON")
+    unknown = set(delta) - set(DELTA_SECTIONS)
+    if unknown:
+        raise ValueError(f"חלק לא מוכר ב-delta: {', '.join(sorted(map(str, unknown)))}")
+    for name, section in delta.items():
+        _check_delta_section(name, section)
+    return delta
+
+def _delta_value(col: str, value: Any):
+    if col == "site_capacity":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"קיבולת לא תקינה: {value}")
+    return normalize_text(value)
+
+def _apply_delta(df: pd.DataFrame, delta: Optional[dict], key: str, columns: List[str]):
+    """
+    מחיל add / remove / edit על טבלה מזוהה. מחזיר (טבלה חדשה, מיקום בטבלה הישנה לכל שורה
+    (-1 = נוספה), {מיקום חדש: עמודות שהשתנו}). שורות שנוספו מצורפות בסוף, לפי הסדר.
+    """
+    section = next((name for name, k in DELTA_SECTIONS.items() if k == key), key)
+    delta = _check_delta_section(section, delta)
+    keys = df[key].tolist()
+    removed = {normalize_text(k) for k in delta.get("remove", [])}
+    missing = sorted(removed - set(keys))
+    if missing:
+        raise ValueError(f"לא נמצאו להסרה: {', '.join(missing)}")
+
+    keep = np.array([k not in removed for k in keys], dtype=bool)
+    old_pos = np.nonzero(keep)[0]
+    out = df[keep].reset_index(drop=True)
+    # עמודות Categorical נערכות כמחרוזות ומקודדות מחדש בסוף (ערך חדש אינו קטגוריה קיימת)
+    categorical = [c for c in out.columns if isinstance(out[c].dtype, pd.CategoricalDtype)]
+    out = out.astype({c: object for c in categorical})
+
+    rows_of = {}
+    for pos, k in enumerate(out[key]):
+        rows_of.setdefault(k, []).append(pos)
+    edited = {}
+    for change in delta.get("edit", []):
+        k = normalize_text(change.get(key))
+        if k not in rows_of:
+            raise ValueError(f"לא נמצא לעריכה: {k}")
+        for col, value in change.items():
+            if col == key:
+                continue
+            if col not in columns:
+                raise ValueError(f"עמודה לא מוכרת: {col}")
+            value = _delta_value(col, value)
+            for pos in rows_of[k]:
+                if out.at[pos, col] != value:
+                    out.at[pos, col] = value
+                    edited.setdefault(pos, set()).add(col)
+
+    added = []
+    for row in delta.get("add", []):
+        if not normalize_text(row.get(key)):
+            raise ValueError(f"שורה חדשה בלי {key}")
+        unknown = set(row) - set(columns)
+        if unknown:
+            raise ValueError(f"עמודה לא מוכרת: {', '.join(sorted(unknown))}")
+        added.append({col: _delta_value(col, row.get(col, 1 if col == "site_capacity" else ""))
+                      for col in columns})
+    if added:
+        new_rows = pd.DataFrame(added)
+        if "capacity_left" in out.columns:
+            new_rows["capacity_left"] = new_rows["site_capacity"]
+        out = pd.concat([out, new_rows[list(out.columns)]], ignore_index=True)
+        old_pos = np.concatenate([old_pos, np.full(len(added), -1, dtype=np.int64)])
+    for c in categorical:
+        out[c] = interned_text(out[c])
+    return out, old_pos, edited
+
+@dataclass
+class RematchOutcome:
+    students: pd.DataFrame   # הטבלאות המזוהות אחרי השינוי
+    sites: pd.DataFrame
+    assign: np.ndarray       # אינדקס אתר לכל סטודנט/ית (-1 = לא שובץ/ה)
+    score: np.ndarray        # ציון באתר שנבחר (-1 = לא שובץ/ה)
+    changed: np.ndarray      # מסכה: שיבוץ שחושב מחדש
+    old_pos: np.ndarray      # מיקום בריצה הקודמת (-1 = נוסף/ה)
+    pairs: np.ndarray        # זוגות מוצהרים (partner_pairs) ו-placed / issues כמו ב-partner_report
+    placed: np.ndarray
+    partner_issues: list
+
+def rematch(students_df: pd.DataFrame, sites_df: pd.DataFrame, assign: np.ndarray, score: np.ndarray,
+            W: Weights, delta: dict, max_per_supervisor: int = MAX_STUDENTS_PER_SUPERVISOR) -> RematchOutcome:
+    """
+    תיקון מקומי של שיבוץ קיים אחרי delta. assign / score הם השיבוץ והציון הקודמים לכל סטודנט/ית.
+
+    משתחררים: סטודנטים שנוספו או נערכו, מי שהאתר שלו/ה הוסר או שתחום/עיר/מדריך שלו השתנו,
+    והאחרונים בקובץ באתר שהקיבולת שלו ירדה מתחת למספר המשובצים. הם משובצים מחדש בחמדנות
+    (לפי סדר הקובץ) מול המקומות הפנויים. אחר כך כל מקום שהתפנה (או נוסף) מוצע למי שירוויח ממנו
+    הכי הרבה – קודם כל מי שלא שובץ/ה – ומי שעובר/ת משחרר/ת מקום שמוצע בתורו, עד שאין שיפור.
+    מחושבות רק שורות הניקוד של המשוחררים ועמודות הניקוד של האתרים שהתפנו.
+
+    זוגות מוצהרים: אם אחד/ת מבני הזוג משתחרר/ת (או שהזוג חדש) – משתחררים שניהם ומשובצים קודם
+    יחד (assign_pairs). זוג שמשובץ יחד לא זז בשלב השיפור, שמעביר סטודנטים אחד/ת אחד/ת.
+    """
+    delta = check_delta(delta)
+    students, stu_old, stu_edited = _apply_delta(students_df, delta.get("students"), "stu_id", DELTA_STUDENT_COLS)
+    sites, site_old, site_edited = _apply_delta(sites_df, delta.get("sites"), "site_name", DELTA_SITE_COLS)
+    n, m = len(students), len(sites)
+    assign = np.asarray(assign, dtype=np.int64)
+    score = np.asarray(score, dtype=np.int64)
+
+    site_map = np.full(len(sites_df), -1, dtype=np.int64)
+    site_map[site_old[site_old >= 0]] = np.nonzero(site_old >= 0)[0]
+    capacity = sites["site_capacity"].to_numpy(dtype=np.int64)
+
+    new_assign = np.full(n, -1, dtype=np.int64)
+    new_score = np.full(n, -1, dtype=np.int64)
+    kept = np.nonzero(stu_old >= 0)[0]
+    prev = assign[stu_old[kept]]
+    new_assign[kept] = np.where(prev >= 0, site_map[np.maximum(prev, 0)], -1)
+    new_score[kept] = np.where(new_assign[kept] >= 0, score[stu_old[kept]], -1)
+
+    # אתרים שהתפנה בהם מקום או שנוספה להם קיבולת – נבדקים בשלב השיפור
+    touched = np.zeros(m, dtype=bool)
+    touched[site_old < 0] = True
+    touched[list(site_edited)] = True
+    gone = np.setdiff1d(np.arange(len(students_df)), stu_old[kept])
+    freed = site_map[assign[gone][assign[gone] >= 0]]
+    touched[freed[freed >= 0]] = True
+
+    affected = np.zeros(n, dtype=bool)
+    affected[stu_old < 0] = True
+    affected[list(stu_edited)] = True
+    affected[kept[(prev >= 0) & (new_assign[kept] < 0)]] = True
+    rescored = [j for j, cols in site_edited.items() if cols & SITE_MATCH_COLS]
+    affected |= np.isin(new_assign, rescored)
+    used = np.bincount(new_assign[(new_assign >= 0) & ~affected], minlength=m)
+    for j in np.nonzero(used > capacity)[0]:
+        occupants = np.nonzero((new_assign == j) & ~affected)[0]
+        affected[occupants[max(0, capacity[j]):]] = True
+
+    # זוג שאחד/ת ממנו משתחרר/ת, או זוג חדש (נוסף/ה או שונה בן/בת הזוג) – משתחררים שניהם
+    pairs, partner_issues = partner_pairs(students)
+    partner_edited = np.zeros(n, dtype=bool)
+    partner_edited[[pos for pos, cols in stu_edited.items() if "stu_partner" in cols]] = True
+    released = (affected[pairs] | partner_edited[pairs] | (stu_old[pairs] < 0)).any(axis=1)
+    affected[pairs[released].ravel()] = True
+
+    touched[new_assign[affected & (new_assign >= 0)]] = True
+    new_assign[affected] = -1
+    new_score[affected] = -1
+
+    sup_codes = supervisor_codes(sites)
+    sup_named = supervisor_named(sites)
+    n_sup = int(sup_codes.max()) + 1 if m else 0
+
+    def counts():
+        placed = new_assign >= 0
+        return (capacity - np.bincount(new_assign[placed], minlength=m),
+                np.bincount(sup_codes[new_assign[placed]], minlength=n_sup))
+
+    # 1) המשוחררים – קודם הזוגות יחד, ואז שיבוץ חמדני של השאר מול מה שנשאר פנוי
+    free, sup_count = counts()
+    todo = np.nonzero(affected)[0]
+    if len(todo) and m:
+        rows = ScoreMatrix(students.iloc[todo], sites, W)
+        row_of = np.full(n, -1, dtype=np.int64)
+        row_of[todo] = np.arange(len(todo))
+        pair_rows = row_of[pairs[released]]
+        got = np.full(len(todo), -1, dtype=np.int64)
+        if len(pair_rows):
+            placed_rows, _, _ = assign_pairs(rows.score, pair_rows, np.maximum(free, 0), sup_codes, sup_named,
+                                             max_per_supervisor, supervisor_count=sup_count)
+            together = placed_rows[:, 0] >= 0
+            got[pair_rows[together].ravel()] = placed_rows[together].ravel()
+            new_assign[todo] = got
+            free, sup_count = counts()
+        rest = np.nonzero(got < 0)[0]
+        sub = rows.take(rest)
+        got[rest] = greedy_assign(sub.score, sub.profile, np.maximum(free, 0), sup_codes,
+                                  max_per_supervisor, supervisor_count=sup_count)
+        new_assign[todo] = got
+        ok = got >= 0
+        new_score[todo[ok]] = rows.score[np.nonzero(ok)[0], got[ok]]
+        free, sup_count = counts()
+
+    # זוגות שמשובצים יחד לא זזים בשלב השיפור
+    locked = np.zeros(n, dtype=bool)
+    locked[pairs[pairs_together(pairs, new_assign, sup_codes, sup_named)].ravel()] = True
+
+    # 2) שיפור – כל מקום פנוי באתר שנגעו בו מוצע למי שירוויח ממנו הכי הרבה
+    sites_of_sup = [[] for _ in range(n_sup)]
+    for j, s in enumerate(sup_codes):
+        sites_of_sup[s].append(j)
+    moved = np.zeros(n, dtype=bool)
+    columns = {}
+    queue = deque(np.nonzero(touched & (free > 0))[0].tolist())
+    while queue:
+        j = queue.popleft()
+        s = sup_codes[j]
+        while free[j] > 0:
+            col = columns.get(j)
+            if col is None:
+                col = columns[j] = ScoreMatrix(students, sites.iloc[[j]], W).score[:, 0].astype(np.int64)
+            gain = col - new_score
+            gain[(new_assign == j) | locked] = 0
+            if sup_count[s] >= max_per_supervisor:
+                # המדריך מלא – עוברים לאתר רק מי שכבר אצלו/ה, או מי שלא שובץ/ה בכלל
+                # (כמו ב-greedy_assign: כשאין אתר שעובר את הסינון בוחרים מכל הפנויים)
+                placed = new_assign >= 0
+                gain[placed & (sup_codes[np.maximum(new_assign, 0)] != s)] = 0
+            i = int(np.argmax(gain)) if n else 0
+            if not n or gain[i] <= 0:
+                break
+            old = int(new_assign[i])
+            new_assign[i], new_score[i] = j, col[i]
+            free[j] -= 1
+            sup_count[s] += 1
+            moved[i] = True
+            if old >= 0:
+                free[old] += 1
+                sup_count[sup_codes[old]] -= 1
+                queue.append(old)
+                if sup_count[sup_codes[old]] == max_per_supervisor - 1:
+                    queue.extend(k for k in sites_of_sup[sup_codes[old]] if free[k] > 0)
+
+    together = pairs_together(pairs, new_assign, sup_codes, sup_named)
+    placed = np.where(together[:, None], new_assign[pairs], -1)
+    sites = sites.copy()
+    sites["capacity_left"] = free
+    return RematchOutcome(students, sites, new_assign, new_score, affected | moved, stu_old,
+                          pairs, placed, partner_issues)
+
+def rematch_results(prev_results: pd.DataFrame, outcome: RematchOutcome, W: Weights) -> pd.DataFrame:
+    """טבלת תוצאות אחרי rematch: שורות שלא השתנו נלקחות מהריצה הקודמת, והשאר נבנות מחדש."""
+    students, sites, assign, changed = outcome.students, outcome.sites, outcome.assign, outcome.changed
+    stu_old = outcome.old_pos
+    same = np.nonzero(~changed)[0]
+    kept = prev_results.iloc[stu_old[same]].set_axis(same)
+    todo = np.nonzero(changed)[0]
+    if len(todo) and len(sites):
+        rows = ScoreMatrix(students.iloc[todo], sites, W)
+        fresh = assignment_to_results(students.iloc[todo], sites, rows, assign[todo])
+    else:
+        fresh = pd.DataFrame([_unassigned_row(*students.iloc[i][["stu_id", "stu_first", "stu_last"]])
+                              for i in todo], columns=prev_results.columns)
+    fresh = fresh.set_axis(todo)
+    return pd.concat([kept, fresh]).sort_index().reset_index(drop=True)
+
+def rematch_diff(prev_results: pd.DataFrame, results: pd.DataFrame, stu_old: np.ndarray) -> pd.DataFrame:
+    """ההבדלים מול הריצה הקודמת: מי נוסף/ה, הוסר/ה, עבר/ה אתר או שהציון שלו/ה השתנה."""
+    columns = ["ת\"ז הסטודנט", "שם הסטודנט/ית", "שינוי", "אתר קודם", "אתר חדש", "ציון קודם", "ציון חדש"]
+
+    def names(df):
+        return (df["שם פרטי"].astype(str) + " " + df["שם משפחה"].astype(str)).str.strip().tolist()
+
+    rows = []
+    kept = np.nonzero(stu_old >= 0)[0]
+    before, after = prev_results.iloc[stu_old[kept]], results.iloc[kept]
+    b_site, a_site = before["שם מקום ההתמחות"].tolist(), after["שם מקום ההתמחות"].tolist()
+    b_score, a_score = before["אחוז התאמה"].astype(int).tolist(), after["אחוז התאמה"].astype(int).tolist()
+    for k, (stu_id, name) in enumerate(zip(after["ת\"ז הסטודנט"], names(after))):
+        if b_site[k] != a_site[k]:
+            rows.append([stu_id, name, "הועבר/ה", b_site[k], a_site[k], b_score[k], a_score[k]])
+        elif b_score[k] != a_score[k]:
+            rows.append([stu_id, name, "ציון השתנה", b_site[k], a_site[k], b_score[k], a_score[k]])
+
+    added = results.iloc[np.nonzero(stu_old < 0)[0]]
+    for stu_id, name, site, sc in zip(added["ת\"ז הסטודנט"], names(added),
+                                      added["שם מקום ההתמחות"], added["אחוז התאמה"]):
+        rows.append([stu_id, name, "נוסף/ה", "", site, None, int(sc)])
+
+    removed = prev_results.iloc[np.setdiff1d(np.arange(len(prev_results)), stu_old[kept])]
+    for stu_id, name, site, sc in zip(removed["ת\"ז הסטודנט"], names(removed),
+                                      removed["שם מקום ההתמחות"], removed["אחוז התאמה"]):
+        rows.append([stu_id, name, "הוסר/ה", site, "", int(sc), None])
+    return pd.DataFrame(rows, columns=columns).astype({"ציון קודם": "Int64", "ציון חדש": "Int64"})
+
+# --- יצירת XLSX ---
+def df_to_xlsx_bytes(df: pd.DataFrame, sheet_name: str = "שיבוץ") -> bytes:
+    xlsx_io = BytesIO()
+    import xlsxwriter
+
+    with pd.ExcelWriter(xlsx_io, engine="xlsxwriter") as writer:
+        cols = list(df.columns)
+        has_match_col = "אחוז התאמה" in cols
+        if has_match_col:
+            cols = [c for c in cols if c != "אחוז התאמה"] + ["אחוז התאמה"]
+
+        df[cols].to_excel(writer, index=False, sheet_name=sheet_name)
+
+        if has_match_col:
+            workbook = writer.book
+            worksheet = writer.sheets[sheet_name]
+            red_fmt = workbook.add_format({"font_color": "red"})
+            col_idx = len(cols) - 1
+            worksheet.set_column(col_idx, col_idx, 12, red_fmt)
+
+    xlsx_io.seek(0)
+    return xlsx_io.getvalue()
+
+# מעל מספר שורות זה ה-XLSX נכתב ב-constant_memory: כל שורה נכתבת לדיסק ומשוחררת מיד
+XLSX_CONSTANT_MEMORY_ROWS = 5000
+EXPORT_CHUNK_ROWS = 5000
+
+def write_xlsx(df: pd.DataFrame, target, sheet_name: str = "שיבוץ",
+               constant_memory: Optional[bool] = None) -> None:
+    """
+    כותב את df ישירות לקובץ XLSX (נתיב), שורה אחרי שורה, בלי לבנות את הגיליון בזיכרון.
+    אותו מבנה כמו df_to_xlsx_bytes: "אחוז התאמה" בעמודה האחרונה ובאדום.
+    """
+    import xlsxwriter
+
+    if constant_memory is None:
+        constant_memory = len(df) >= XLSX_CONSTANT_MEMORY_ROWS
+    cols = list(df.columns)
+    has_match_col = "אחוז התאמה" in cols
+    if has_match_col:
+        cols = [c for c in cols if c != "אחוז התאמה"] + ["אחוז התאמה"]
+
+    workbook = xlsxwriter.Workbook(target, {"constant_memory": constant_memory})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        if has_match_col:
+            col_idx = len(cols) - 1
+            worksheet.set_column(col_idx, col_idx, 12, workbook.add_format({"font_color": "red"}))
+        header_fmt = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        worksheet.write_row(0, 0, cols, header_fmt)
+
+        row = 1
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            block = df.iloc[start:start + EXPORT_CHUNK_ROWS][cols]
+            block = block.astype(object).where(block.notna(), None)
+            for values in block.itertuples(index=False, name=None):
+                worksheet.write_row(row, 0, values)
+                row += 1
+    finally:
+        workbook.close()
+
+def csv_chunks(df: pd.DataFrame) -> Iterator[bytes]:
+    """CSV (UTF-8 עם BOM, כדי ש-Excel יזהה עברית) בחתיכות של EXPORT_CHUNK_ROWS שורות."""
+    yield "\ufeff".encode("utf-8")
+    if df.empty:
+        yield df.to_csv(index=False).encode("utf-8")
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        yield df.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(index=False, header=(start == 0)).encode("utf-8")
+
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    with open(path, "wb") as fh:
+        for chunk in csv_chunks(df):
+            fh.write(chunk)
+
+# ========= טבלאות הריצה =========
+def results_view(base_df: pd.DataFrame) -> pd.DataFrame:
+    """טבלת תוצאות להצגה / להורדה."""
+    return pd.DataFrame({
+        "אחוז התאמה": base_df["אחוז התאמה"].astype(int),
+        "שם הסטודנט/ית": (base_df["שם פרטי"].astype(str) + " " + base_df["שם משפחה"].astype(str)).str.strip(),
+        "תעודת זהות": base_df["ת\"ז הסטודנט"],
+        "תחום התמחות": base_df["תחום ההתמחות במוסד"],
+        "עיר המוסד": base_df["עיר המוסד"],
+        "שם מקום ההתמחות": base_df["שם מקום ההתמחות"],
+        "שם המדריך/ה": base_df["שם המדריך"],
+    }).sort_values("אחוז התאמה", ascending=False)
+
+def summarize_results(base_df: pd.DataFrame) -> pd.DataFrame:
+    """סיכום לפי אתר/תחום/מדריך."""
+    summary_df = (
+        base_df
+        .groupby(["שם מקום ההתמחות", "תחום ההתמחות במוסד", "שם המדריך"])
+        .agg({
+            "ת\"ז הסטודנט": "count",
+            "שם פרטי": list,
+            "שם משפחה": list
+        }).reset_index()
+    )
+    summary_df.rename(columns={"ת\"ז הסטודנט": "כמה סטודנטים"}, inplace=True)
+    summary_df["המלצת שיבוץ"] = summary_df.apply(
+        lambda row: " + ".join(
+            [f"{f} {l}" for f, l in zip(row["שם פרטי"], row["שם משפחה"])]
+        ),
+        axis=1
+    )
+    return summary_df[[
+        "שם מקום ההתמחות",
+        "תחום ההתמחות במוסד",
+        "שם המדריך",
+        "כמה סטודנטים",
+        "המלצת שיבוץ"
+    ]]
+
+def capacity_report(base_df: pd.DataFrame, sites: pd.DataFrame) -> pd.DataFrame:
+    """קיבולות מול שיבוץ בפועל."""
+    caps = sites.groupby("site_name")["site_capacity"].sum().to_dict()
+    assigned = base_df.groupby("שם מקום ההתמחות")["ת\"ז הסטודנט"].count().to_dict()
+    cap_rows = []
+    for site_name, capacity in caps.items():
+        used = int(assigned.get(site_name, 0))
+        cap_rows.append({
+            "שם מקום ההתמחות": site_name,
+            "קיבולת": int(capacity),
+            "שובצו בפועל": used,
+            "יתרה/חוסר": int(capacity - used)
+        })
+    return pd.DataFrame(cap_rows, columns=["שם מקום ההתמחות", "קיבולת", "שובצו בפועל", "יתרה/חוסר"]).sort_values("שם מקום ההתמחות")
+
+def explanations_frame(base_df: pd.DataFrame) -> pd.DataFrame:
+    """הסברים לכל הסטודנטים כטבלה (לדפדוף/סינון); parts הוא פירוק הציון."""
+    return pd.DataFrame({
+        "student": (base_df["שם פרטי"].astype(str) + " " + base_df["שם משפחה"].astype(str)),
+        "site": base_df["שם מקום ההתמחות"],
+        "score": base_df["אחוז התאמה"].astype(int),
+        "parts": base_df["_expl"],
+    })
+
+
+# ========= צינור מלא לזוג קבצים =========
+EXPORT_SHEETS = {"results": "תוצאות", "summary": "סיכום", "capacities": "קיבולות"}
+PIPELINE_FORMATS = ("xlsx", "csv", "parquet")
+
+def file_fingerprint(path: str) -> str:
+    """sha256 של תוכן הקובץ – אותה טביעה כמו להעלאה דרך האתר."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def export_frame(df: pd.DataFrame, path_base: str, fmt: str, sheet_name: str = "שיבוץ") -> str:
+    """כותב את df ל-<path_base>.<fmt> ומחזיר את הנתיב."""
+    path = f"{path_base}.{fmt}"
+    if fmt == "xlsx":
+        write_xlsx(df, path, sheet_name)
+    elif fmt == "csv":
+        write_csv(df, path)
+    elif fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        raise ValueError(f"פורמט לא נתמך: {fmt}")
+    return path
+
+def run_pipeline(students_path: str, sites_path: str, out_dir: str, mode: str = "greedy",
+                 W: Optional[Weights] = None, formats: Sequence[str] = ("xlsx",),
+                 timings: Optional[StageTimings] = None, history=None, run_id: str = "") -> dict:
+    """
+    resolve -> match -> summarize -> export לזוג קבצים (סטודנטים, אתרים).
+    כותב ל-out_dir את results / summary / capacities בכל פורמט ב-formats, ו-report.json
+    עם דוח השיבוץ, זמני השלבים ומספרי השורות. מחזיר את אותו דוח.
+    history (RunHistory), אם הועבר, מקבל את הריצה תחת run_id (ברירת מחדל: מזהה חדש).
+    """
+    timings = timings if timings is not None else StageTimings()
+    W = W or Weights()
+    if mode not in MATCH_MODES:
+        raise ValueError(f"שיטת שיבוץ לא מוכרת: {mode}")
+    unknown = [f for f in formats if f not in PIPELINE_FORMATS]
+    if unknown:
+        raise ValueError(f"פורמט לא נתמך: {', '.join(unknown)}")
+
+    with timings.stage("read"):
+        students_raw = read_students_table(students_path, students_path)
+        sites_raw = read_sites_table(sites_path, sites_path)
+    with timings.stage("resolve"):
+        students = resolve_students(students_raw)[RESOLVED_STUDENT_COLS].reset_index(drop=True)
+        sites = resolve_sites(sites_raw)[RESOLVED_SITE_COLS].reset_index(drop=True)
+        del students_raw, sites_raw
+    with timings.stage("match"):
+        base_df, report = run_matching(students, sites, W, mode=mode)
+    with timings.stage("summarize"):
+        tables = {
+            "results": results_view(base_df),
+            "summary": summarize_results(base_df),
+            "capacities": capacity_report(base_df, sites),
+        }
+    with timings.stage("export"):
+        os.makedirs(out_dir, exist_ok=True)
+        files = [export_frame(df, os.path.join(out_dir, name), fmt, EXPORT_SHEETS[name])
+                 for name, df in tables.items() for fmt in formats]
+    if history is not None:
+        run_id = run_id or uuid.uuid4().hex
+        with timings.stage("history"):
+            history.record(run_id, base_df, tables["capacities"],
+                           {"mode": mode, "report": report, "weights": asdict(W)},
+                           students_fp=file_fingerprint(students_path),
+                           sites_fp=file_fingerprint(sites_path))
+        report["run_id"] = run_id
+
+    report.update({
+        "students_file": students_path,
+        "sites_file": sites_path,
+        "weights": {"w_field": W.w_field, "w_city": W.w_city, "w_special": W.w_special},
+        "rows": {"students": len(students), "sites": len(sites)},
+        "files": [os.path.basename(f) for f in files],
+        "timings": dict(timings.stages),
+    })
+    with open(os.path.join(out_dir, "report.json"), "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    return report
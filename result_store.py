@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+מאגר תוצאות לפי מזהה ריצה (run id).
+
+כל ריצת שיבוץ נשמרת בזיכרון (LRU + TTL + מגבלת גודל) ובמקביל נכתבת לדיסק
+כ-Parquet, כך שכל worker של gunicorn יכול להגיש הורדה של ריצה שלא הוא הריץ.
+קבצי יצוא (XLSX / CSV) נשמרים באותה תיקייה ונמחקים יחד עם הריצה.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import pandas as pd
+
+DEFAULT_RUNS_DIR = os.path.join(tempfile.gettempdir(), "placement_runs")
+
+
+@dataclass
+class StoredRun:
+    run_id: str
+    frames: Dict[str, pd.DataFrame]
+    meta: dict = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    nbytes: int = 0
+
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _json_columns(df: pd.DataFrame):
+    """עמודות שמכילות dict/list (למשל _expl) – נשמרות לדיסק כ-JSON."""
+    cols = []
+    for c in df.columns:
+        if df[c].dtype == object and len(df) and isinstance(df[c].iloc[0], (dict, list)):
+            cols.append(c)
+    return cols
+
+
+class RunStore:
+    """
+    מאגר ריצות: זיכרון (OrderedDict לפי סדר שימוש) מעל תיקיית Parquet משותפת.
+    max_runs / max_bytes מגבילים את הזיכרון; ttl_seconds חל גם על הזיכרון וגם על הדיסק.
+    """
+
+    def __init__(self, root: str = DEFAULT_RUNS_DIR, max_runs: int = 16,
+                 max_bytes: int = 256 * 1024 * 1024, ttl_seconds: int = 6 * 3600):
+        self.root = root
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._runs: "OrderedDict[str, StoredRun]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def new_run_id() -> str:
+        return uuid.uuid4().hex
+
+    def _run_dir(self, run_id: str) -> str:
+        # מזהה ריצה מגיע מה-URL – מאפשרים רק hex כדי לא לצאת מהתיקייה
+        if not run_id or not all(ch in "0123456789abcdef" for ch in run_id):
+            raise KeyError(run_id)
+        return os.path.join(self.root, run_id)
+
+    # ---------- כתיבה ----------
+    def put(self, run_id: str, frames: Dict[str, pd.DataFrame], meta: Optional[dict] = None) -> StoredRun:
+        run = StoredRun(run_id=run_id, frames=dict(frames), meta=dict(meta or {}))
+        run.nbytes = sum(_frame_nbytes(df) for df in run.frames.values())
+        self._spill(run)
+        with self._lock:
+            self._remember(run)
+        self.purge_expired()
+        return run
+
+    def _spill(self, run: StoredRun) -> None:
+        final_dir = self._run_dir(run.run_id)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            json_cols = {}
+            for name, df in run.frames.items():
+                cols = _json_columns(df)
+                json_cols[name] = cols
+                out = df.copy() if cols else df
+                for c in cols:
+                    out[c] = out[c].map(lambda v: json.dumps(v, ensure_ascii=False))
+                out.to_parquet(os.path.join(tmp_dir, f"{name}.parquet"), index=False)
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as fh:
+                json.dump({"meta": run.meta, "created_at": run.created_at, "json_columns": json_cols},
+                          fh, ensure_ascii=False)
+            # החלפה אטומית – worker אחר לעולם לא יראה ריצה חצי כתובה
+            os.replace(tmp_dir, final_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def _remember(self, run: StoredRun) -> None:
+        old = self._runs.pop(run.run_id, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._runs[run.run_id] = run
+        self._bytes += run.nbytes
+        while self._runs and (len(self._runs) > self.max_runs or self._bytes > self.max_bytes):
+            _, evicted = self._runs.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    # ---------- קריאה ----------
+    def get(self, run_id: str) -> Optional[StoredRun]:
+        now = time.time()
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None:
+                if now - run.created_at > self.ttl_seconds:
+                    self._runs.pop(run_id)
+                    self._bytes -= run.nbytes
+                    run = None
+                else:
+                    self._runs.move_to_end(run_id)
+                    return run
+
+        run = self._load(run_id)
+        if run is None or now - run.created_at > self.ttl_seconds:
+            return None
+        with self._lock:
+            self._remember(run)
+        return run
+
+    def get_frame(self, run_id: str, name: str) -> Optional[pd.DataFrame]:
+        run = self.get(run_id)
+        if run is None:
+            return None
+        return run.frames.get(name)
+
+    def _load(self, run_id: str) -> Optional[StoredRun]:
+        try:
+            run_dir = self._run_dir(run_id)
+            with open(os.path.join(run_dir, "meta.json"), encoding="utf-8") as fh:
+                info = json.load(fh)
+        except (KeyError, OSError, ValueError):
+            return None
+
+        frames = {}
+        for name, cols in info.get("json_columns", {}).items():
+            df = pd.read_parquet(os.path.join(run_dir, f"{name}.parquet"))
+            for c in cols:
+                df[c] = df[c].map(json.loads)
+            frames[name] = df
+        run = StoredRun(run_id=run_id, frames=frames, meta=info.get("meta", {}),
+                        created_at=info.get("created_at", 0.0))
+        run.nbytes = sum(_frame_nbytes(df) for df in frames.values())
+        return run
+
+    # ---------- קבצים נלווים (למשל יצוא להורדה) ----------
+    def artifact_path(self, run_id: str, filename: str) -> Optional[str]:
+        """נתיב לקובץ שנשמר לצד הריצה, או None אם אין כזה / הריצה לא קיימת או שפג תוקפה."""
+        try:
+            run_dir = self._run_dir(run_id)
+            created = os.stat(os.path.join(run_dir, "meta.json")).st_mtime
+        except (KeyError, OSError):
+            return None
+        path = os.path.join(run_dir, filename)
+        if time.time() - created > self.ttl_seconds or not os.path.isfile(path):
+            return None
+        return path
+
+    def frame_path(self, run_id: str, name: str) -> Optional[str]:
+        """קובץ ה-Parquet של טבלה מהריצה (רק לטבלאות בלי עמודות JSON)."""
+        return self.artifact_path(run_id, f"{name}.parquet")
+
+    def write_artifact(self, run_id: str, filename: str, write: Callable[[str], None]) -> str:
+        """write(path) כותב לקובץ זמני בתיקיית הריצה, שמוחלף אטומית בשם הסופי."""
+        run_dir = self._run_dir(run_id)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=run_dir)
+        os.close(fd)
+        try:
+            write(tmp)
+            path = os.path.join(run_dir, filename)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path
+
+    def stream_artifact(self, run_id: str, filename: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        מעביר את chunks הלאה (למשל ללקוח) ובמקביל כותב אותם לצד הריצה.
+        הקובץ נשמר רק אם הזרם הסתיים במלואו.
+        """
+        run_dir = self._run_dir(run_id)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=run_dir)
+        completed = False
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+                    yield chunk
+            os.replace(tmp, os.path.join(run_dir, filename))
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp):
+                os.remove(tmp)
+
+    # ---------- ניקוי ----------
+    def purge_expired(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                continue
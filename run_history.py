@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+היסטוריית ריצות ב-SQLite.
+
+כל ריצה (טביעת הקבצים, המשקלים, השיבוץ ופירוק הציון _expl לכל סטודנט/ית, והקיבולות)
+נכתבת בטרנזקציה אחת לקובץ SQLite מקומי. בניגוד ל-RunStore אין כאן TTL – המטרה היא
+לענות על שאלות בין ריצות: איפה שובץ/ה סטודנט/ית בשלוש הריצות האחרונות, כמה מלא היה
+אתר לאורך זמן, כמה סטודנטים היו אצל מדריך/ה. לשאלות האלה יש אינדקסים על ת"ז, שם אתר
+ושם מדריך, כך שהן נשארות מהירות גם אחרי מאות ריצות.
+
+חיבור חדש לכל פעולה (WAL + busy timeout) – בטוח לכמה workers של gunicorn ולתהליכי עבודה.
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+# ההיסטוריה נשמרת לאורך זמן, ולכן לא בתיקייה הזמנית (שמתנקה באתחול) אלא ב-instance/ ליד האפליקציה
+DEFAULT_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "placement_history.sqlite")
+
+# מפתחות _expl -> עמודות בטבלת assignments
+EXPL_COLUMNS = {
+    "התאמת תחום": "pts_field",
+    "מרחק/גיאוגרפיה": "pts_city",
+    "בקשות מיוחדות": "pts_special",
+    "עדיפויות הסטודנט/ית": "pts_priority",
+}
+UNASSIGNED_SITE = "לא שובץ"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    mode        TEXT,
+    parent_run  TEXT,
+    students_fp TEXT,
+    sites_fp    TEXT,
+    w_field     REAL,
+    w_city      REAL,
+    w_special   REAL,
+    students    INTEGER,
+    assigned    INTEGER,
+    total_score INTEGER,
+    report      TEXT
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    run_id       TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    created_at   REAL NOT NULL,
+    stu_id       TEXT NOT NULL,
+    first_name   TEXT,
+    last_name    TEXT,
+    site_name    TEXT,
+    site_city    TEXT,
+    site_field   TEXT,
+    supervisor   TEXT,
+    score        INTEGER,
+    pts_field    INTEGER,
+    pts_city     INTEGER,
+    pts_special  INTEGER,
+    pts_priority INTEGER
+);
+CREATE TABLE IF NOT EXISTS site_loads (
+    run_id     TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    created_at REAL NOT NULL,
+    site_name  TEXT NOT NULL,
+    capacity   INTEGER,
+    assigned   INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs(created_at);
+CREATE INDEX IF NOT EXISTS assignments_run ON assignments(run_id);
+CREATE INDEX IF NOT EXISTS assignments_student ON assignments(stu_id, created_at);
+CREATE INDEX IF NOT EXISTS assignments_site ON assignments(site_name, run_id);
+CREATE INDEX IF NOT EXISTS assignments_supervisor ON assignments(supervisor, run_id);
+CREATE INDEX IF NOT EXISTS site_loads_site ON site_loads(site_name, created_at);
+CREATE INDEX IF NOT EXISTS site_loads_run ON site_loads(run_id);
+"""
+
+RUN_FIELDS = ("run_id", "created_at", "mode", "parent_run", "students_fp", "sites_fp",
+              "w_field", "w_city", "w_special", "students", "assigned", "total_score")
+
+
+def _rows(cursor) -> List[dict]:
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def _int(value) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+class RunHistory:
+    """כתיבה בכמות (executemany בטרנזקציה אחת) ושאילתות בין ריצות."""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            con.execute("PRAGMA foreign_keys=ON")
+            with con:  # commit / rollback
+                yield con
+        finally:
+            con.close()
+
+    # ---------- כתיבה ----------
+    def record(self, run_id: str, results, capacities=None, meta: Optional[dict] = None,
+               students_fp: str = "", sites_fp: str = "", created_at: Optional[float] = None) -> None:
+        """
+        שומר ריצה: results היא טבלת התוצאות המלאה (עם _expl), capacities – capacity_report.
+        meta כמו ב-RunStore: mode, weights, report. ריצה קיימת באותו מזהה נכתבת מחדש.
+        """
+        meta = meta or {}
+        report = meta.get("report", {})
+        weights = meta.get("weights", {})
+        created_at = time.time() if created_at is None else created_at
+
+        sites = results["שם מקום ההתמחות"].tolist()
+        expl = results["_expl"].tolist()
+        assignment_rows = [
+            (run_id, created_at, str(stu_id), first, last,
+             None if site == UNASSIGNED_SITE else site, city or None, field or None, sup or None,
+             int(score), *(_int(parts.get(k)) for k in EXPL_COLUMNS))
+            for stu_id, first, last, site, city, field, sup, score, parts in zip(
+                results["ת\"ז הסטודנט"].tolist(), results["שם פרטי"].tolist(),
+                results["שם משפחה"].tolist(), sites, results["עיר המוסד"].tolist(),
+                results["תחום ההתמחות במוסד"].tolist(), results["שם המדריך"].tolist(),
+                results["אחוז התאמה"].tolist(), expl)
+        ]
+        load_rows = []
+        if capacities is not None:
+            load_rows = [(run_id, created_at, name, int(cap), int(used)) for name, cap, used in zip(
+                capacities["שם מקום ההתמחות"].tolist(), capacities["קיבולת"].tolist(),
+                capacities["שובצו בפועל"].tolist())]
+
+        run_row = (run_id, created_at, meta.get("mode"), report.get("parent_run"), students_fp, sites_fp,
+                   weights.get("w_field"), weights.get("w_city"), weights.get("w_special"),
+                   len(assignment_rows), _int(report.get("assigned")), _int(report.get("total_score")),
+                   json.dumps(report, ensure_ascii=False))
+        with self._connect() as con:
+            con.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            con.execute(f"INSERT INTO runs VALUES ({', '.join('?' * 13)})", run_row)
+            con.executemany(f"INSERT INTO assignments VALUES ({', '.join('?' * 14)})", assignment_rows)
+            con.executemany("INSERT INTO site_loads VALUES (?, ?, ?, ?, ?)", load_rows)
+
+    def delete(self, run_id: str) -> bool:
+        with self._connect() as con:
+            return con.execute("DELETE FROM runs WHERE run_id = ?", (run_id,)).rowcount > 0
+
+    # ---------- קריאה ----------
+    def runs(self, limit: int = 50) -> List[dict]:
+        """הריצות האחרונות, מהחדשה לישנה."""
+        with self._connect() as con:
+            return _rows(con.execute(
+                f"SELECT {', '.join(RUN_FIELDS)} FROM runs ORDER BY created_at DESC LIMIT ?", (limit,)))
+
+    def run(self, run_id: str) -> Optional[dict]:
+        with self._connect() as con:
+            rows = _rows(con.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)))
+        if not rows:
+            return None
+        run = rows[0]
+        run["report"] = json.loads(run["report"] or "{}")
+        return run
+
+    def run_assignments(self, run_id: str) -> List[dict]:
+        with self._connect() as con:
+            return _rows(con.execute(
+                "SELECT * FROM assignments WHERE run_id = ? ORDER BY rowid", (run_id,)))
+
+    def student_history(self, stu_id: str, limit: int = 3) -> List[dict]:
+        """איפה שובץ/ה הסטודנט/ית ב-limit הריצות האחרונות שבהן הופיע/ה."""
+        with self._connect() as con:
+            return _rows(con.execute(
+                "SELECT a.*, r.mode FROM assignments a JOIN runs r USING (run_id) "
+                "WHERE a.stu_id = ? ORDER BY a.created_at DESC LIMIT ?", (str(stu_id), limit)))
+
+    def site_history(self, site_name: str, limit: int = 50) -> List[dict]:
+        """תפוסת אתר לאורך הריצות: קיבולת, משובצים ואחוז תפוסה."""
+        with self._connect() as con:
+            rows = _rows(con.execute(
+                "SELECT run_id, created_at, capacity, assigned FROM site_loads "
+                "WHERE site_name = ? ORDER BY created_at DESC LIMIT ?", (site_name, limit)))
+        for row in rows:
+            row["fill_pct"] = round(100.0 * row["assigned"] / row["capacity"], 1) if row["capacity"] else None
+        return rows
+
+    def supervisor_history(self, supervisor: str, limit: int = 50) -> List[dict]:
+        """כמה סטודנטים שובצו אצל המדריך/ה בכל ריצה, באילו אתרים ובאיזה ציון ממוצע."""
+        with self._connect() as con:
+            # הריצות האחרונות שבהן המדריך/ה מופיע/ה: סריקה לפי runs_created ובדיקה באינדקס (supervisor, run_id)
+            runs = _rows(con.execute(
+                "SELECT run_id, created_at FROM runs r WHERE EXISTS (SELECT 1 FROM assignments a "
+                "WHERE a.supervisor = ? AND a.run_id = r.run_id) ORDER BY created_at DESC LIMIT ?",
+                (supervisor, limit)))
+            for run in runs:
+                rows = con.execute(
+                    "SELECT site_name, COUNT(*), SUM(score) FROM assignments "
+                    "WHERE supervisor = ? AND run_id = ? GROUP BY site_name ORDER BY site_name",
+                    (supervisor, run["run_id"])).fetchall()
+                run["students"] = sum(n for _, n, _ in rows)
+                run["sites"] = [site for site, _, _ in rows]
+                run["avg_score"] = round(sum(total for _, _, total in rows) / run["students"], 1)
+        return runs
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+cli.py: שמות מחזורים במניפסט לא יוצאים מתיקיית הפלט, ותהליך עבודה שמת מסמן רק את המחזור שלו כנכשל.
+"""
+import json
+import os
+
+import pytest
+
+import cli
+
+
+def write_manifest(tmp_path, names):
+    path = tmp_path / "manifest.csv"
+    path.write_text("cohort,students,sites\n" + "".join(f"{n},s.csv,t.csv\n" for n in names),
+                    encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("name", ["../escape", "a/b", "a\\b", "..", ".", ""])
+def test_manifest_rejects_unsafe_cohort_names(tmp_path, name):
+    with pytest.raises(ValueError):
+        cli.discover_cohorts(write_manifest(tmp_path, ["ok", name]))
+    assert cli.main([write_manifest(tmp_path, [name]), "-o", str(tmp_path / "out")]) == 2
+
+
+def test_manifest_accepts_plain_names(tmp_path):
+    cohorts = cli.discover_cohorts(write_manifest(tmp_path, ["2025 א", "social-work.b"]))
+    assert [c.name for c in cohorts] == ["2025 א", "social-work.b"]
+
+
+def crash_or_report(cohort, out_root, mode, formats, history_path=""):
+    if cohort.name == "boom":
+        os._exit(1)
+    return {"cohort": cohort.name, "state": "done", "seconds": 0.0, "timings": {}}
+
+
+def test_dead_worker_fails_its_cohort_and_timings_are_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "run_cohort", crash_or_report)
+    cohorts = [cli.Cohort(n, "s.csv", "t.csv") for n in ("boom", "a", "b")]
+    summary = cli.run_batch(cohorts, str(tmp_path), workers=2)
+
+    assert [r["cohort"] for r in summary["cohorts"]] == ["boom", "a", "b"]
+    assert "boom" in summary["failed"]
+    assert "BrokenProcessPool" in summary["cohorts"][0]["error"]
+    with open(tmp_path / "timings.json", encoding="utf-8") as fh:
+        assert json.load(fh)["failed"] == summary["failed"]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+greedy_assign מול הלולאה המקורית של greedy_match (לפני המעבר לרשימות ממוינות לפי פרופיל).
+
+reference_greedy הוא העתק של הלולאה הישנה על מטריצת ציונים: לכל סטודנט/ית לפי הסדר –
+האתרים הפנויים, סינון לפי מגבלת המדריך, ואם לא נשאר אתר – הטוב מכל הפנויים. בשוויון
+ציונים נבחר האתר הראשון בקובץ (מיון יציב), כמו ב-greedy_assign.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from placement import (MAX_STUDENTS_PER_SUPERVISOR, ScoreMatrix, Weights, greedy_assign,
+                       greedy_match, resolve_sites, resolve_students, supervisor_codes)
+
+
+def reference_greedy(score, capacity, supervisors, max_per_supervisor=MAX_STUDENTS_PER_SUPERVISOR):
+    cap_left = list(capacity)
+    supervisor_count = {}
+    assign = []
+    for row in score:
+        cand = [j for j in range(len(cap_left)) if cap_left[j] > 0]
+        if not cand:
+            assign.append(-1)
+            continue
+        filtered = [j for j in cand if supervisor_count.get(supervisors[j], 0) < max_per_supervisor]
+        if not filtered:
+            filtered = cand
+        chosen = sorted(filtered, key=lambda j: -int(row[j]))[0]  # sorted יציב
+        cap_left[chosen] -= 1
+        supervisor_count[supervisors[chosen]] = supervisor_count.get(supervisors[chosen], 0) + 1
+        assign.append(chosen)
+    return np.array(assign, dtype=np.int64)
+
+
+def profiles(score):
+    """שורות ניקוד זהות -> אותו פרופיל, כמו ScoreMatrix.profile."""
+    codes, _ = pd.factorize(pd.Series([row.tobytes() for row in score]))
+    return codes
+
+
+def run_both(score, capacity, supervisors):
+    sup = supervisor_codes(pd.DataFrame({"שם המדריך": supervisors}))
+    got = greedy_assign(score, profiles(score), np.array(capacity), sup)
+    expected = reference_greedy(score, capacity, supervisors)
+    return got, expected
+
+
+def random_cohort(rng, n_students, n_sites, n_supervisors, score_levels):
+    score = rng.choice(score_levels, size=(n_students, n_sites)).astype(np.int16)
+    capacity = rng.integers(0, 4, size=n_sites).tolist()
+    names = [""] + [f"מדריך {k}" for k in range(n_supervisors)]
+    supervisors = [names[k] for k in rng.integers(0, len(names), size=n_sites)]
+    return score, capacity, supervisors
+
+
+def test_ties_pick_first_site_in_file():
+    score = np.full((5, 4), 80, dtype=np.int16)
+    got, expected = run_both(score, [1, 1, 1, 1], ["א", "ב", "ג", "ד"])
+    assert got.tolist() == expected.tolist() == [0, 1, 2, 3, -1]
+
+
+def test_supervisor_cap_falls_back_to_best_open_site():
+    # מדריך אחד לכל האתרים: אחרי MAX_STUDENTS_PER_SUPERVISOR אין אתר מותר, ועוברים לטוב מהפנויים
+    score = np.tile(np.array([90, 70, 50], dtype=np.int16), (6, 1))
+    got, expected = run_both(score, [2, 2, 2], ["דנה לוי"] * 3)
+    assert got.tolist() == expected.tolist()
+    assert sorted(got.tolist()) == [0, 0, 1, 1, 2, 2]
+
+
+def test_zero_capacity_sites_are_never_used():
+    score = np.tile(np.array([100, 90, 80, 70], dtype=np.int16), (4, 1))
+    got, expected = run_both(score, [0, 2, 0, 1], ["א", "ב", "ג", "ד"])
+    assert got.tolist() == expected.tolist() == [1, 1, 3, -1]
+
+
+def test_unnamed_supervisors_share_one_cap():
+    # כמו בלולאה המקורית, שם מדריך ריק נספר כמדריך אחד
+    score = np.tile(np.array([90, 80, 70, 60], dtype=np.int16), (5, 1))
+    got, expected = run_both(score, [3, 3, 3, 3], ["", "", "", "רון כהן"])
+    assert got.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_cohorts_match_reference(seed):
+    rng = np.random.default_rng(seed)
+    n_students = int(rng.integers(0, 60))
+    n_sites = int(rng.integers(1, 25))
+    levels = [0, 50, 100] if seed % 2 else list(range(0, 101, 5))
+    score, capacity, supervisors = random_cohort(rng, n_students, n_sites, int(rng.integers(1, 6)), levels)
+    got, expected = run_both(score, capacity, supervisors)
+    assert got.tolist() == expected.tolist()
+
+
+def test_greedy_match_on_resolved_frames():
+    rng = np.random.default_rng(7)
+    cities = ["חיפה", "תל אביב - יפו", "צפת", "באר שבע", ""]
+    fields = ["רווחה", "שיקום", "קהילה", "בריאות הנפש"]
+    students = pd.DataFrame({
+        "תעודת זהות": [str(100 + i) for i in range(40)],
+        "שם פרטי": [f"סטודנט{i}" for i in range(40)],
+        "שם משפחה": ["כהן"] * 40,
+        "עיר מגורים": rng.choice(cities, 40),
+        "תחום מועדף": rng.choice(fields + ["רווחה; שיקום", ""], 40),
+        "בקשה מיוחדת": rng.choice(["", "קרוב לבית", "אזור צפון"], 40),
+    })
+    sites = pd.DataFrame({
+        "מוסד": [f"אתר {j}" for j in range(12)],
+        "תחום ההתמחות": rng.choice(fields, 12),
+        "עיר": rng.choice(cities[:-1], 12),
+        "קיבולת": rng.integers(0, 5, 12),
+        "שם פרטי": rng.choice(["", "נועה", "יוסי"], 12),
+        "שם משפחה": rng.choice(["", "לוי"], 12),
+    })
+    stu, site = resolve_students(students), resolve_sites(sites)
+    scores = ScoreMatrix(stu, site, Weights())
+    expected = reference_greedy(scores.score, site["capacity_left"].tolist(), site["שם המדריך"].tolist())
+
+    results = greedy_match(stu, site, Weights(), scores)
+    names = site["site_name"].tolist()
+    assert results["שם מקום ההתמחות"].tolist() == [names[j] if j >= 0 else "לא שובץ" for j in expected]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+JobManager כשתהליך עבודה מת באמצע: העבודה מסומנת failed, וה-pool השבור מוחלף בחדש.
+"""
+import os
+import time
+
+from jobs import JobManager
+
+
+def crash_job(job_id, status):
+    os._exit(1)  # כמו OOM killer – בלי חריגה ובלי כתיבת סטטוס
+
+
+def ok_job(job_id, status):
+    status.progress(1, 1)
+
+
+def wait_for(manager, job_id, timeout=20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = (manager.status(job_id) or {}).get("state")
+        if state in ("done", "failed"):
+            return manager.status(job_id)
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_killed_worker_marks_job_failed_and_pool_recovers(tmp_path):
+    finished = []
+    manager = JobManager(str(tmp_path), max_workers=1, on_finish=finished.append)
+
+    manager.submit("a1", crash_job)
+    status = wait_for(manager, "a1")
+    assert status["state"] == "failed"
+    assert status["error"]
+
+    manager.submit("b2", ok_job)
+    status = wait_for(manager, "b2")
+    assert status["state"] == "done"
+    assert status["progress"] == {"done": 1, "total": 1}
+
+    deadline = time.time() + 5
+    while len(finished) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert [s["state"] for s in finished] == ["failed", "done"]
+    assert manager._pending == 0
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+זוגות מוצהרים: בחירת שני אתרים אצל אותו/ה מדריך/ה (שלב 2 ב-assign_pairs) והתקדמות run_matching בסטודנטים.
+"""
+import numpy as np
+import pandas as pd
+
+from placement import Weights, assign_pairs, resolve_sites, resolve_students, run_matching
+
+
+def test_two_sites_of_supervisor_checks_every_candidate():
+    # אצל מדריך/ה 0 החסם (100 + 100) גבוה, אבל שניהם באותו אתר עם מקום אחד – בפועל רק 100.
+    # אצל מדריך/ה 1 יש שני אתרים של 90 – הזוג צריך להגיע לשם
+    score = np.array([[100, 0, 90, 90],
+                      [100, 0, 90, 90]], dtype=np.int16)
+    placed, cap_left, _ = assign_pairs(score, np.array([[0, 1]]), np.ones(4, dtype=np.int64),
+                                       np.array([0, 0, 1, 1]), np.ones(4, dtype=bool))
+    assert sorted(placed[0].tolist()) == [2, 3]
+    assert cap_left.tolist() == [1, 1, 0, 0]
+
+
+def test_two_sites_of_supervisor_prefers_best_exact_pair():
+    score = np.array([[100, 0, 80, 0, 60],
+                      [100, 0, 0, 80, 60]], dtype=np.int16)
+    placed, _, _ = assign_pairs(score, np.array([[0, 1]]), np.ones(5, dtype=np.int64),
+                                np.array([0, 0, 1, 1, 1]), np.ones(5, dtype=bool))
+    assert placed[0].tolist() == [2, 3]
+
+
+def test_progress_counts_students_with_pairs():
+    n = 30
+    students = resolve_students(pd.DataFrame({
+        "תעודת זהות": [str(100 + i) for i in range(n)],
+        "שם פרטי": [f"סטודנט{i}" for i in range(n)],
+        "שם משפחה": ["כהן"] * n,
+        "עיר מגורים": ["חיפה"] * n,
+        "תחום מועדף": ["רווחה"] * n,
+        "בקשה מיוחדת": [""] * n,
+        "בן/בת זוג להכשרה": [str(101 + i) if i < 10 and i % 2 == 0 else "" for i in range(n)],
+    }))
+    sites = resolve_sites(pd.DataFrame({
+        "מוסד": [f"אתר {j}" for j in range(8)],
+        "תחום ההתמחות": ["רווחה"] * 8,
+        "עיר": ["חיפה"] * 8,
+        "קיבולת": [4] * 8,
+        "שם פרטי": [f"מדריך{j}" for j in range(8)],
+        "שם משפחה": ["לוי"] * 8,
+    }))
+    calls = []
+    _, report = run_matching(students, sites, Weights(), progress=lambda done, total: calls.append((done, total)))
+    assert report["partners"]["pairs"] == 5
+    assert {total for _, total in calls} == {n}
+    done = [d for d, _ in calls]
+    assert done == sorted(done) and done[0] == 10 and done[-1] == n
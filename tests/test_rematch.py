@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+delta לא תקין לשיבוץ מחדש: ValueError עם הודעה (400 ב-API), ולא AttributeError באמצע או התעלמות שקטה.
+"""
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from placement import Weights, check_delta, rematch, resolve_sites, resolve_students
+
+MALFORMED = [
+    "students",
+    {"students": []},
+    {"students": "x"},
+    {"students": {"add": "x"}},
+    {"students": {"add": ["x"]}},
+    {"students": {"edit": {"stu_id": "1"}}},
+    {"students": {"edit": [["1", "stu_req"]]}},
+    {"students": {"remove": "1"}},
+    {"students": {"remove": [{"stu_id": "1"}]}},
+    {"students": {"remove": [True]}},
+    {"students": {"update": []}},
+    {"sites": {"edit": [None]}},
+    {"student": {"remove": ["1"]}},
+]
+
+
+def cohort():
+    students = resolve_students(pd.DataFrame({
+        "תעודת זהות": ["1", "2"],
+        "שם פרטי": ["א", "ב"],
+        "שם משפחה": ["כהן", "לוי"],
+        "עיר מגורים": ["חיפה", "צפת"],
+        "תחום מועדף": ["רווחה", "שיקום"],
+        "בקשה מיוחדת": ["", ""],
+    }))
+    sites = resolve_sites(pd.DataFrame({
+        "מוסד": ["אתר 1", "אתר 2"],
+        "תחום ההתמחות": ["רווחה", "שיקום"],
+        "עיר": ["חיפה", "צפת"],
+        "קיבולת": [1, 1],
+    }))
+    return students, sites
+
+
+@pytest.mark.parametrize("delta", MALFORMED)
+def test_malformed_delta_raises_value_error(delta):
+    students, sites = cohort()
+    with pytest.raises(ValueError):
+        check_delta(delta)
+    with pytest.raises(ValueError):
+        rematch(students, sites, np.array([0, 1]), np.array([100, 100]), Weights(), delta)
+
+
+def test_well_formed_delta_passes():
+    students, sites = cohort()
+    delta = {"students": {"remove": ["2"], "edit": [{"stu_id": "1", "stu_req": "קרוב לבית"}]},
+             "sites": {"add": [{"site_name": "אתר 3", "site_capacity": 2}], "remove": []}}
+    assert check_delta(delta) is delta
+    outcome = rematch(students, sites, np.array([0, 1]), np.array([100, 100]), Weights(), delta)
+    assert outcome.students["stu_id"].tolist() == ["1"]
+    assert check_delta(None) == {}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("HISTORY_DB", str(tmp_path / "history.sqlite"))
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path / "runs"))
+    app_module = importlib.import_module("app")
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize("delta", [d for d in MALFORMED if isinstance(d, dict)])
+def test_api_rematch_rejects_malformed_delta(client, delta):
+    r = client.post("/api/runs/0123abcd/rematch", json=delta)
+    assert r.status_code == 400
+    assert r.get_json()["error"]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+רכיב העיר ליישובים שלא במאגר: אותה עיר = 100, אחרת ניטרלי (50) – בלי עונש על יישוב חסר –
+וזהות בין ScoreMatrix לבין compute_score_with_explain.
+"""
+import pandas as pd
+
+from placement import (ScoreMatrix, Weights, city_points, compute_score_with_explain, gazetteer,
+                       resolve_sites, resolve_students, run_matching, unresolved_cities)
+
+UNKNOWN = "כפר בדוי"  # לא קיים במאגר
+
+
+def test_unknown_city_is_neutral_not_penalized():
+    assert gazetteer.lookup(UNKNOWN) < 0
+    assert city_points(UNKNOWN, "חיפה") == 50
+    assert city_points("חיפה", UNKNOWN) == 50
+    assert city_points(UNKNOWN, UNKNOWN) == 100
+    assert city_points("חיפה", "חיפה") == 100
+    assert city_points("", "חיפה") == 50
+
+
+def cohort():
+    students = resolve_students(pd.DataFrame({
+        "תעודת זהות": ["1", "2", "3"],
+        "שם פרטי": ["א", "ב", "ג"],
+        "שם משפחה": ["כהן", "לוי", "מזרחי"],
+        "עיר מגורים": [UNKNOWN, "חיפה", ""],
+        "תחום מועדף": ["רווחה", "שיקום", ""],
+        "בקשה מיוחדת": ["קרוב לבית", "", "קרוב לבית"],
+    }))
+    sites = resolve_sites(pd.DataFrame({
+        "מוסד": ["אתר 1", "אתר 2", "אתר 3"],
+        "תחום ההתמחות": ["רווחה", "שיקום", "קהילה"],
+        "עיר": ["חיפה", UNKNOWN, "מושב נעלם"],
+        "קיבולת": [1, 1, 1],
+    }))
+    return students, sites
+
+
+def test_score_matrix_matches_row_scoring_for_unknown_cities():
+    students, sites = cohort()
+    scores = ScoreMatrix(students, sites, Weights())
+    for i in range(len(students)):
+        for j in range(len(sites)):
+            expected, _ = compute_score_with_explain(students.iloc[i], sites.iloc[j], Weights())
+            assert int(scores.score[i, j]) == expected
+
+
+def test_unresolved_cities_are_reported():
+    students, sites = cohort()
+    assert unresolved_cities(students, sites) == {"students": [UNKNOWN], "sites": [UNKNOWN, "מושב נעלם"]}
+    _, report = run_matching(students, sites, Weights())
+    assert report["unresolved_cities"]["sites"] == [UNKNOWN, "מושב נעלם"]
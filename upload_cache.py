@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+מטמון לקבצים שהועלו, לפי hash של התוכן.
+
+העלאה חוזרת של אותו קובץ (גם בשם אחר) מדלגת על קריאת ה-Excel ועל זיהוי העמודות:
+הטבלה המזוהה (עמודות stu_* / site_*) נשמרת כ-Parquet ונקראת מחדש ישירות.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from io import BytesIO
+from typing import Callable, List
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "placement_upload_cache")
+
+
+class UploadCache:
+    """
+    מטמון דיסק עם פינוי LRU (לפי זמן שימוש אחרון) ומגבלת מספר קבצים/גודל.
+    hits / misses נספרים לכל תהליך.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_entries: int = 64,
+                 max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def content_key(data: bytes, filename: str, kind: str, version: str) -> str:
+        # הסיומת משפיעה על אופן הקריאה (CSV / Excel), ולכן היא חלק מהמפתח
+        ext = os.path.splitext((filename or "").lower())[1]
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{kind}-{version}-{ext.lstrip('.') or 'csv'}-{digest}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.parquet")
+
+    def load_resolved(self, uploaded, kind: str, version: str,
+                      read: Callable[[BytesIO, str], pd.DataFrame],
+                      resolve: Callable[[pd.DataFrame], pd.DataFrame],
+                      columns: List[str]) -> pd.DataFrame:
+        """מחזיר את הטבלה המזוהה עבור קובץ שהועלה (FileStorage של Flask)."""
+        return self.load_resolved_bytes(uploaded.read(), uploaded.filename or "", kind, version,
+                                        read, resolve, columns)
+
+    def load_resolved_bytes(self, data: bytes, filename: str, kind: str, version: str,
+                            read: Callable[[BytesIO, str], pd.DataFrame],
+                            resolve: Callable[[pd.DataFrame], pd.DataFrame],
+                            columns: List[str]) -> pd.DataFrame:
+        """
+        כמו load_resolved, עבור תוכן קובץ שכבר נקרא (למשל בתהליך עבודה ברקע).
+        בפגיעה – קריאת Parquet בלבד; בהחטאה – read -> resolve, ושמירת columns למטמון.
+        """
+        key = self.content_key(data, filename, kind, version)
+        path = self._path(key)
+
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)  # מעדכנים זמן שימוש לטובת LRU
+            with self._lock:
+                self.hits += 1
+            return df
+        except (OSError, ValueError):
+            pass
+
+        with self._lock:
+            self.misses += 1
+        df = resolve(read(BytesIO(data), filename))[columns].reset_index(drop=True)
+        self._write(path, df)
+        self._evict()
+        return df
+
+    def _write(self, path: str, df: pd.DataFrame) -> None:
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".parquet", dir=self.root)
+        os.close(fd)
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _evict(self) -> None:
+        try:
+            entries = [e for e in os.scandir(self.root) if e.name.endswith(".parquet") and not e.name.startswith(".")]
+            entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries), reverse=True)
+        except OSError:
+            return
+        total = 0
+        for n, (_, size, path) in enumerate(entries):
+            total += size
+            if n >= self.max_entries or total > self.max_bytes:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }